@@ -206,6 +206,14 @@ PYBIND11_MODULE(_native, m)
                 }
                 return r;
             })
+        .def("append_uint16_be_uint32_be",
+            [](WrappedSerializer& me, uint16_t a, uint32_t b) {
+                bool r = me.append_uint16_be_uint32_be(a, b);
+                if (!r) {
+                    throw std::runtime_error("Buffer overflow");
+                }
+                return r;
+            })
         .def("append_uint8",
             [](WrappedSerializer& me, uint8_t value) {
                 bool r = me.append_uint8(value);
@@ -255,7 +263,8 @@ PYBIND11_MODULE(_native, m)
                 std::string s((const char*)me.buffer(), me.length());
                 return py::bytes(s);
             })
-        .def("length", &WrappedSerializer::length);
+        .def("length", &WrappedSerializer::length)
+        .def("reset", &WrappedSerializer::reset);
 
     m.def("local_mac", &local_mac);
 
@@ -26,6 +26,7 @@ _MODULES = {
     "ImageShiftToUint8Operator": "image_shift_to_uint8_operator",
     "LinuxReceiver": "linux_receiver",
     "LinuxReceiverOperator": "linux_receiver_operator",
+    "LinuxReceiverPool": "linux_receiver",
     "RoceReceiverOp": "roce_receiver",
 }
 
@@ -17,8 +17,14 @@
 
 #include <hololink/operators/linux_receiver/linux_receiver.hpp>
 
+#include <algorithm>
+
 #include <pybind11/functional.h>
+#include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
+
+#include <holoscan/core/conditions/gxf/asynchronous.hpp>
 
 using pybind11::literals::operator""_a;
 
@@ -29,6 +35,34 @@ namespace py = pybind11;
 
 namespace hololink::operators {
 
+// ~LinuxReceiver joins the receiver thread, which may be waiting for
+// the GIL in a Python frame_ready callback; so release the GIL while
+// deleting it.
+struct LinuxReceiverDeleter {
+    void operator()(LinuxReceiver* receiver)
+    {
+        py::gil_scoped_release release;
+        delete receiver;
+    }
+};
+
+// One element of the structured array returned by get_next_frames;
+// these are the same fields that LinuxReceiverMetadata.as_dict provides.
+struct FrameRecord {
+    uint32_t frame_number;
+    uint32_t frame_packets_received;
+    uint32_t frame_bytes_received;
+    int64_t received_s;
+    int64_t received_ns;
+    uint64_t timestamp_s;
+    uint32_t timestamp_ns;
+    uint64_t metadata_s;
+    uint32_t metadata_ns;
+    uint64_t packets_dropped;
+    uint32_t crc;
+    uint32_t psn;
+};
+
 PYBIND11_MODULE(_linux_receiver, m)
 {
 #ifdef VERSION_INFO
@@ -37,11 +71,35 @@ PYBIND11_MODULE(_linux_receiver, m)
     m.attr("__version__") = "dev";
 #endif
 
+    PYBIND11_NUMPY_DTYPE(FrameRecord, frame_number, frame_packets_received, frame_bytes_received,
+        received_s, received_ns, timestamp_s, timestamp_ns, metadata_s, metadata_ns,
+        packets_dropped, crc, psn);
+
     // NOTE: pybind11 never implicitly release the GIL (see https://pybind11.readthedocs.io/en/stable/advanced/misc.html#global-interpreter-lock-gil),
     //       therefore for blocking function explicitly release the GIL using `py::call_guard<py::gil_scoped_release>()`.
-    py::class_<LinuxReceiver>(m, "LinuxReceiver")
-        .def(py::init<CUdeviceptr, size_t, int, uint64_t>(), "cu_buffer"_a, "cu_buffer_size"_a, "socket"_a, "received_address_offset"_a)
+    py::class_<LinuxReceiverPool, std::shared_ptr<LinuxReceiverPool>>(m, "LinuxReceiverPool")
+        .def(py::init<size_t>(), "frame_size"_a)
+        .def("buffer_size", &LinuxReceiverPool::buffer_size)
+        .def_property_readonly_static("BUFFERS", [](py::object) { return LinuxReceiverPool::BUFFERS; })
+        .def(
+            "device_buffer", [](LinuxReceiverPool& self, unsigned index) {
+                if (index >= LinuxReceiverPool::BUFFERS) {
+                    throw py::index_error(fmt::format("index={} is out of range.", index));
+                }
+                return self.device_buffer(index);
+            },
+            "index"_a);
+
+    py::class_<LinuxReceiver, std::unique_ptr<LinuxReceiver, LinuxReceiverDeleter>>(m, "LinuxReceiver")
+        .def(py::init<CUdeviceptr, size_t, int, uint64_t, bool, bool, std::shared_ptr<LinuxReceiverPool>>(), "cu_buffer"_a, "cu_buffer_size"_a, "socket"_a, "received_address_offset"_a, "use_io_uring"_a = false, "zero_copy"_a = false, "pool"_a = py::none(),
+            py::keep_alive<1, 8>())
         .def("run", &LinuxReceiver::run, py::call_guard<py::gil_scoped_release>())
+        .def(
+            "start", [](LinuxReceiver& self, py::object cu_context, const std::vector<int>& affinity) {
+                self.start(reinterpret_cast<CUcontext>(cu_context.cast<int64_t>()), affinity);
+            },
+            "cu_context"_a, "affinity"_a = std::vector<int>())
+        .def("join", &LinuxReceiver::join, py::call_guard<py::gil_scoped_release>())
         .def("close", &LinuxReceiver::close)
         .def(
             "get_next_frame", [](LinuxReceiver& self, unsigned timeout_ms) {
@@ -50,9 +108,70 @@ PYBIND11_MODULE(_linux_receiver, m)
                 return std::make_tuple(success, metadata);
             },
             py::call_guard<py::gil_scoped_release>(), "timeout_ms"_a)
+        .def(
+            "get_next_frames", [](LinuxReceiver& self, unsigned count, unsigned timeout_ms) {
+                // We never have more than this many to return.
+                count = std::min(count, LinuxReceiver::METADATA_HISTORY);
+                std::vector<LinuxReceiverMetadata> metadata(count);
+                unsigned n = 0;
+                {
+                    py::gil_scoped_release release;
+                    n = self.get_next_frames_metadata(count, timeout_ms, metadata.data());
+                }
+                py::array_t<FrameRecord> r(n);
+                FrameRecord* records = r.mutable_data();
+                for (unsigned i = 0; i < n; i++) {
+                    const LinuxReceiverMetadata& me = metadata[i];
+                    records[i] = FrameRecord {
+                        .frame_number = me.frame_number,
+                        .frame_packets_received = me.frame_packets_received,
+                        .frame_bytes_received = me.frame_bytes_received,
+                        .received_s = me.received_s,
+                        .received_ns = me.received_ns,
+                        .timestamp_s = me.frame_metadata.timestamp_s,
+                        .timestamp_ns = me.frame_metadata.timestamp_ns,
+                        .metadata_s = me.frame_metadata.metadata_s,
+                        .metadata_ns = me.frame_metadata.metadata_ns,
+                        .packets_dropped = me.packets_dropped,
+                        .crc = me.frame_metadata.crc,
+                        .psn = me.frame_metadata.psn,
+                    };
+                }
+                return r;
+            },
+            "count"_a, "timeout_ms"_a)
         .def("get_qp_number", &LinuxReceiver::get_qp_number)
         .def("get_rkey", &LinuxReceiver::get_rkey)
-        .def("set_frame_ready", &LinuxReceiver::set_frame_ready, "frame_ready"_a);
+        .def("set_frame_ready", &LinuxReceiver::set_frame_ready, "frame_ready"_a, py::keep_alive<1, 2>())
+        .def("set_busy_poll", &LinuxReceiver::set_busy_poll, "busy_poll_us"_a)
+        .def(
+            "set_frame_ready_condition", [](LinuxReceiver& self, std::shared_ptr<holoscan::AsynchronousCondition> condition) {
+                // Signal the condition directly from the receiver thread;
+                // unlike set_frame_ready, this doesn't acquire the GIL
+                // for every received frame.
+                self.set_frame_ready([condition](const LinuxReceiver&) {
+                    condition->event_state(holoscan::AsynchronousEventState::EVENT_DONE);
+                });
+            },
+            "condition"_a, py::keep_alive<1, 2>());
+
+    // as_dict is called for every received frame; building the keys
+    // once here saves us from creating and hashing new strings each time.
+    auto interned = [](const char* s) {
+        return py::reinterpret_steal<py::str>(PyUnicode_InternFromString(s));
+    };
+    py::str frame_number_key = interned("frame_number");
+    py::str frame_packets_received_key = interned("frame_packets_received");
+    py::str frame_bytes_received_key = interned("frame_bytes_received");
+    py::str received_s_key = interned("received_s");
+    py::str received_ns_key = interned("received_ns");
+    py::str timestamp_s_key = interned("timestamp_s");
+    py::str timestamp_ns_key = interned("timestamp_ns");
+    py::str metadata_s_key = interned("metadata_s");
+    py::str metadata_ns_key = interned("metadata_ns");
+    py::str packets_dropped_key = interned("packets_dropped");
+    py::str crc_key = interned("crc");
+    py::str psn_key = interned("psn");
 
     py::class_<LinuxReceiverMetadata>(m, "LinuxReceiverMetadata")
         .def_readonly("frame_packets_received", &LinuxReceiverMetadata::frame_packets_received)
@@ -66,6 +185,7 @@ PYBIND11_MODULE(_linux_receiver, m)
         .def_readonly("packets_dropped", &LinuxReceiverMetadata::packets_dropped)
         .def_readonly("received_s", &LinuxReceiverMetadata::received_s)
         .def_readonly("received_ns", &LinuxReceiverMetadata::received_ns)
+        .def_readonly("frame_memory", &LinuxReceiverMetadata::frame_memory)
         .def_property_readonly("timestamp_s", [](LinuxReceiverMetadata& me) {
             return me.frame_metadata.timestamp_s;
         })
@@ -83,6 +203,24 @@ PYBIND11_MODULE(_linux_receiver, m)
         })
         .def_property_readonly("psn", [](LinuxReceiverMetadata& me) {
             return me.frame_metadata.psn;
+        })
+        .def("as_dict", [=](LinuxReceiverMetadata& me) {
+            // This is the application metadata published
+            // by LinuxReceiverOperator with each frame.
+            py::dict r;
+            r[frame_number_key] = me.frame_number;
+            r[frame_packets_received_key] = me.frame_packets_received;
+            r[frame_bytes_received_key] = me.frame_bytes_received;
+            r[received_s_key] = me.received_s;
+            r[received_ns_key] = me.received_ns;
+            r[timestamp_s_key] = me.frame_metadata.timestamp_s;
+            r[timestamp_ns_key] = me.frame_metadata.timestamp_ns;
+            r[metadata_s_key] = me.frame_metadata.metadata_s;
+            r[metadata_ns_key] = me.frame_metadata.metadata_ns;
+            r[packets_dropped_key] = me.packets_dropped;
+            r[crc_key] = me.frame_metadata.crc;
+            r[psn_key] = me.frame_metadata.psn;
+            return r;
         });
 
 } // PYBIND11_MODULE
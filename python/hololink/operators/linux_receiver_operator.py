@@ -18,9 +18,8 @@
 import logging
 import os
 import socket
-import threading
 
-from cuda import cuda
+import cupy as cp
 
 import hololink as hololink_module
 
@@ -29,97 +28,237 @@ US_PER_SEC = 1000 * MS_PER_SEC
 NS_PER_SEC = 1000 * US_PER_SEC
 SEC_PER_NS = 1.0 / NS_PER_SEC
 
+# Default kernel receive buffer size, large enough to absorb
+# bursts at 10-100 GbE sensor data rates.
+DEFAULT_RCVBUF = 64 * 1024 * 1024
+# From <asm-generic/socket.h>; the Python socket module doesn't define these.
+SO_RCVBUFFORCE = 33
+SO_BUSY_POLL = 46
+SO_PREFER_BUSY_POLL = 69
+# Default time, in microseconds, that the receiver thread keeps
+# checking for received packets before going to sleep.
+DEFAULT_BUSY_POLL_US = 50
+
+
+def _parse_affinity(s):
+    """Converts a CPU list like "2,4-7" to a set of the CPUs
+    in it that we're allowed to run on, or None if there
+    aren't any.  Empty items (e.g. from "2,") are ignored;
+    anything else that isn't a CPU number or ascending range
+    raises ValueError."""
+    cpus = set()
+    for item in s.split(","):
+        item = item.strip()
+        if len(item) == 0:
+            continue
+        first, dash, last = item.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if dash else first
+        except ValueError:
+            raise ValueError(
+                'Invalid HOLOLINK_AFFINITY item "%s" in "%s".' % (item, s)
+            ) from None
+        if first > last:
+            raise ValueError(
+                'Invalid HOLOLINK_AFFINITY range "%s" in "%s"; '
+                "ranges must be ascending." % (item, s)
+            )
+        cpus.update(range(first, last + 1))
+    return _available_cpus(cpus, "HOLOLINK_AFFINITY=%s" % (s,))
+
+
+def _available_cpus(cpus, description):
+    """Returns the set of cpus that we're allowed to run on,
+    or None if there aren't any."""
+    allowed = set(cpus) & os.sched_getaffinity(0)
+    if len(allowed) == 0:
+        logging.warning("None of %s are available; ignoring affinity." % (description,))
+        return None
+    return allowed
+
 
 class LinuxReceiverOperator(hololink_module.operators.BaseReceiverOp):
-    def __init__(self, *args, receiver_affinity=None, **kwargs):
+    def __init__(
+        self,
+        *args,
+        receiver_affinity=None,
+        use_io_uring=None,
+        zero_copy=None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self._receiver_affinity = receiver_affinity
-        if self._receiver_affinity is None:
+        if self._receiver_affinity:
+            # Hold the caller's CPU list to the same rules as HOLOLINK_AFFINITY.
+            self._receiver_affinity = _available_cpus(
+                [int(cpu) for cpu in receiver_affinity],
+                "receiver_affinity=%s" % (receiver_affinity,),
+            )
+        elif self._receiver_affinity is None:
             # By default, run us on the third core in the system;
-            # run with HOLOLINK_AFFINITY=<n> to use a different core or
-            # set HOLOLINK_AFFINITY="" to avoid affinity configuration.
+            # run with HOLOLINK_AFFINITY=<cpus> (e.g. "4" or "2,4-7") to use
+            # different cores or set HOLOLINK_AFFINITY="" to avoid affinity
+            # configuration.
             affinity = os.getenv("HOLOLINK_AFFINITY", "2")
-            # The len(affinity) supports this command
+            # The len(affinity.strip()) supports this command
             #   HOLOLINK_AFFINITY= python3 ...
-            # to avoid affinity settings.
-            if (affinity is not None) and (len(affinity) > 0):
-                self._receiver_affinity = {int(affinity)}
+            # (or HOLOLINK_AFFINITY=" ") to avoid affinity settings.
+            if (affinity is not None) and (len(affinity.strip()) > 0):
+                self._receiver_affinity = _parse_affinity(affinity)
+        self._use_io_uring = use_io_uring
+        if self._use_io_uring is None:
+            # Run with HOLOLINK_IO_URING=1 to receive via io_uring instead
+            # of recv; this is ignored if hololink was built without liburing.
+            self._use_io_uring = os.getenv("HOLOLINK_IO_URING", "0") not in ("", "0")
+        self._zero_copy = zero_copy
+        if self._zero_copy is None:
+            # Run with HOLOLINK_ZERO_COPY=1 to have the pipeline read frame data
+            # directly from the (device mapped) host memory it was received into,
+            # instead of copying each frame to our GPU buffer first.
+            self._zero_copy = os.getenv("HOLOLINK_ZERO_COPY", "0") not in ("", "0")
+        # Maps receiver buffer addresses to cupy arrays when zero_copy is set.
+        self._zero_copy_frames = {}
+        # Pinning the memory that the receiver assembles frames into is
+        # expensive, so do that once here and reuse it on every start.
+        self._receiver_pool = hololink_module.operators.LinuxReceiverPool(
+            self._frame_size
+        )
 
     def _start_receiver(self):
-        self._check_buffer_size(self._frame_size)
+        self._configure_socket()
         self._hololink_channel.configure_socket(self._data_socket.fileno())
         self._receiver = hololink_module.operators.LinuxReceiver(
             self._frame_memory,
             self._frame_size,
             self._data_socket.fileno(),
             self.received_address_offset(),
+            use_io_uring=self._use_io_uring,
+            zero_copy=self._zero_copy,
+            pool=self._receiver_pool,
         )
-
-        def _ready(receiver):
-            self.frame_ready()
-
-        self._receiver.set_frame_ready(_ready)
-        self._receiver_thread = threading.Thread(
-            daemon=True, name=self.name, target=self._run
-        )
-        self._receiver_thread.start()
+        self._receiver.set_busy_poll(self._busy_poll_us)
+        # The receiver thread sets our frame ready condition itself,
+        # so there's no call back into Python for each frame.
+        self._receiver.set_frame_ready_condition(self._frame_ready_condition)
+        # The receiver thread is created with its processor affinity already
+        # in place, so it never runs (and warms its cache) on any other core.
+        affinity = sorted(self._receiver_affinity) if self._receiver_affinity else []
+        self._receiver.start(self._frame_context, affinity)
         self._hololink_channel.authenticate(
             self._receiver.get_qp_number(), self._receiver.get_rkey()
         )
 
-    def _run(self):
-        cuda.cuCtxSetCurrent(self._frame_context)
-        if self._receiver_affinity:
-            os.sched_setaffinity(0, self._receiver_affinity)
-        self._receiver.run()
-
     def _stop(self):
         self._receiver.close()
-        self._receiver_thread.join()
+        self._receiver.join()
         # close the socket after the receiver thread stopped
         self._data_socket.close()
+        self._zero_copy_frames.clear()
 
     def _get_next_frame(self, timeout_ms):
         ok, receiver_metadata = self._receiver.get_next_frame(timeout_ms)
         if not ok:
             return None
-        application_metadata = {
-            "frame_number": receiver_metadata.frame_number,
-            "frame_packets_received": receiver_metadata.frame_packets_received,
-            "frame_bytes_received": receiver_metadata.frame_bytes_received,
-            "received_s": receiver_metadata.received_s,
-            "received_ns": receiver_metadata.received_ns,
-            "timestamp_s": receiver_metadata.timestamp_s,
-            "timestamp_ns": receiver_metadata.timestamp_ns,
-            "metadata_s": receiver_metadata.metadata_s,
-            "metadata_ns": receiver_metadata.metadata_ns,
-            "packets_dropped": receiver_metadata.packets_dropped,
-            "crc": receiver_metadata.crc,
-            "psn": receiver_metadata.psn,
-        }
-        return application_metadata
+        if self._zero_copy:
+            self._cp_frame = self._zero_copy_frame(receiver_metadata.frame_memory)
+        return receiver_metadata.as_dict()
+
+    def get_next_frames(self, count, timeout_ms):
+        """Returns a numpy structured array with the metadata for up to
+        count frames received since the last call, oldest first; fields
+        are named like the keys in the metadata published with each frame.
+        """
+        return self._receiver.get_next_frames(count, timeout_ms)
+
+    def _zero_copy_frame(self, frame_memory):
+        # The receiver only ever hands us one of its three
+        # buffers, so we only construct these once per buffer.
+        cp_frame = self._zero_copy_frames.get(frame_memory)
+        if cp_frame is None:
+            unowned_memory = cp.cuda.UnownedMemory(frame_memory, self._frame_size, self)
+            cp_frame = cp.ndarray(
+                (self._frame_size,),
+                dtype=cp.uint8,
+                memptr=cp.cuda.MemoryPointer(unowned_memory, 0),
+            )
+            self._zero_copy_frames[frame_memory] = cp_frame
+        return cp_frame
+
+    def _configure_socket(self):
+        self._check_buffer_size(self._frame_size)
+        # Sensor data arrives at a steady, high rate, so having the receiver
+        # thread spin briefly after the socket goes empty is cheaper than
+        # sleeping between packets.  SO_BUSY_POLL additionally has each of
+        # those (non-blocking) recv calls poll the network device queue.
+        # Run with HOLOLINK_BUSY_POLL_US=0 to disable this.
+        self._busy_poll_us = max(
+            int(os.getenv("HOLOLINK_BUSY_POLL_US", DEFAULT_BUSY_POLL_US)), 0
+        )
+        if self._busy_poll_us == 0:
+            return
+        try:
+            self._data_socket.setsockopt(
+                socket.SOL_SOCKET, SO_BUSY_POLL, self._busy_poll_us
+            )
+        except OSError as e:
+            logging.debug("Unable to set SO_BUSY_POLL: %s" % (e,))
+        try:
+            # Not supported by kernels before 5.11.
+            self._data_socket.setsockopt(socket.SOL_SOCKET, SO_PREFER_BUSY_POLL, 1)
+        except OSError as e:
+            logging.debug("Unable to set SO_PREFER_BUSY_POLL: %s" % (e,))
 
     def _check_buffer_size(self, data_memory_size):
+        # Bursts of sensor data can arrive faster than the receiver thread
+        # drains the socket, so size the kernel buffer for the bandwidth-delay
+        # product of the link rather than for a single frame.  Run with
+        # HOLOLINK_RCVBUF=<bytes> to request a different size.
+        boundary = 0x10000 - 1
+        request_size = max(
+            (data_memory_size + boundary) & ~boundary,
+            int(os.getenv("HOLOLINK_RCVBUF", DEFAULT_RCVBUF)),
+        )
+        # The kernel doubles values set with SO_RCVBUF (to account for
+        # its own bookkeeping overhead), and getsockopt reports that
+        # doubled value--but net.core.rmem_default is applied as-is.  So
+        # compare what we read back against twice what we'd ask for.
         receiver_buffer_size = self._data_socket.getsockopt(
             socket.SOL_SOCKET, socket.SO_RCVBUF
         )
-        if receiver_buffer_size < data_memory_size:
-            # round it up to a 64k boundary
-            boundary = 0x10000 - 1
-            request_size = (data_memory_size + boundary) & ~boundary
+        if receiver_buffer_size >= 2 * request_size:
+            # Already at least as large as setting it would make it
+            # (e.g. via net.core.rmem_default); skip the extra calls.
+            logging.debug(
+                "receiver buffer size=%s is sufficient." % (receiver_buffer_size,)
+            )
+            return
+        try:
+            # SO_RCVBUFFORCE isn't limited by net.core.rmem_max,
+            # but it requires CAP_NET_ADMIN.
+            self._data_socket.setsockopt(
+                socket.SOL_SOCKET, SO_RCVBUFFORCE, request_size
+            )
+        except PermissionError:
             self._data_socket.setsockopt(
                 socket.SOL_SOCKET, socket.SO_RCVBUF, request_size
             )
-            receiver_buffer_size = self._data_socket.getsockopt(
-                socket.SOL_SOCKET, socket.SO_RCVBUF
+        receiver_buffer_size = self._data_socket.getsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF
+        )
+        logging.debug("receiver buffer size=%s" % (receiver_buffer_size,))
+        hint = 'Resolve this with "sudo sysctl -w net.core.rmem_max=%d"' % (
+            request_size,
+        )
+        if receiver_buffer_size < 2 * data_memory_size:
+            logging.warning(
+                "Kernel receiver buffer size is too small; "
+                + "performance will be unreliable."
+            )
+            logging.warning(hint)
+        elif receiver_buffer_size < 2 * request_size:
+            logging.info(
+                "Kernel receiver buffer size is smaller than requested; "
+                + "bursts of network traffic may be dropped."
             )
-            logging.debug("receiver buffer size=%s" % (receiver_buffer_size,))
-            if receiver_buffer_size < data_memory_size:
-                logging.warning(
-                    "Kernel receiver buffer size is too small; "
-                    + "performance will be unreliable."
-                )
-                logging.warning(
-                    'Resolve this with "echo %d | sudo tee /proc/sys/net/core/rmem_max"'
-                    % (request_size,)
-                )
+            logging.info(hint)
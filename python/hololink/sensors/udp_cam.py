@@ -16,6 +16,7 @@
 # See README.md for detailed information.
 
 import logging
+import threading
 
 import hololink as hololink_module
 
@@ -34,12 +35,37 @@ PIXEL_FORMAT = 107
 BAYER_FORMAT = 108
 INITIALIZE = 199
 
+# Configuration registers that hold whatever was last written to them;
+# writing the value they already have is a no-op, so we can skip it.
+# Registers that trigger an action (e.g. RUN, RESET, INITIALIZE) or
+# must be refreshed (WATCHDOG) aren't included here.
+CACHEABLE_REGISTERS = {
+    WIDTH,
+    HEIGHT,
+    FRAMES_PER_MINUTE,
+    PIXEL_FORMAT,
+    BAYER_FORMAT,
+}
+
+# i2c_transaction writes fewer than 0x100 bytes at a time, and each
+# (register, value) pair takes 6; set_registers splits longer lists.
+BURST_REGISTERS = 0xFF // 6
+
 
 class UdpCam:
     def __init__(self, hololink_channel, i2c_address=hololink_module.CAM_I2C_CTRL):
         self._hololink_channel = hololink_channel
         self._hololink = hololink_channel.hololink()
         self._i2c = self._hololink.get_i2c(i2c_address)
+        # Register accesses reuse this buffer instead of allocating their own;
+        # callers on different threads (e.g. tap_watchdog from one operator
+        # and stop from another) take _scratch_lock while serializing into it.
+        self._scratch = bytearray(6 * BURST_REGISTERS)
+        self._serializer = hololink_module.Serializer(self._scratch)
+        self._scratch_lock = threading.Lock()
+        # Maps CACHEABLE_REGISTERS to the value we last wrote there.
+        self._reg_cache = {}
+        self._version = None
 
     def configure(self, height, width, bayer_format, pixel_format, frame_rate_s):
         # Make sure this is a version we know about.
@@ -71,45 +97,95 @@ class UdpCam:
 
     def reset(self):
         self.set_register(RESET, 1)
+        self._reg_cache.clear()
 
     def get_version(self):
-        return self.get_register(VERSION)
+        # The version never changes, so only read it once.
+        if self._version is None:
+            self._version = self.get_register(VERSION)
+        return self._version
 
     def get_register(self, register):
         logging.debug("get_register(register=%d)" % (register,))
-        write_bytes = bytearray(100)
-        serializer = hololink_module.Serializer(write_bytes)
-        serializer.append_uint16_be(register)
+        with self._scratch_lock:
+            serializer = self._serializer
+            serializer.reset()
+            serializer.append_uint16_be(register)
+            write_bytes = self._scratch[: serializer.length()]
         read_byte_count = 4
-        reply = self._i2c.i2c_transaction(
-            I2C_ADDRESS, write_bytes[: serializer.length()], read_byte_count
-        )
+        reply = self._i2c.i2c_transaction(I2C_ADDRESS, write_bytes, read_byte_count)
         deserializer = hololink_module.Deserializer(reply)
         r = deserializer.next_uint32_be()
         return r
 
     def set_register(self, register, value, timeout=None):
+        if (timeout is None) and (self._reg_cache.get(register) == value):
+            logging.trace("set_register(register=%d) unchanged." % (register,))
+            return
         logging.debug("set_register(register=%d, value=0x%X)" % (register, value))
-        write_bytes = bytearray(100)
-        serializer = hololink_module.Serializer(write_bytes)
-        serializer.append_uint16_be(register)
-        serializer.append_uint32_be(value)
+        with self._scratch_lock:
+            serializer = self._serializer
+            serializer.reset()
+            serializer.append_uint16_be_uint32_be(register, value)
+            write_bytes = self._scratch[: serializer.length()]
         read_byte_count = 0
         self._i2c.i2c_transaction(
             I2C_ADDRESS,
-            write_bytes[: serializer.length()],
+            write_bytes,
             read_byte_count,
             timeout=timeout,
         )
+        self._cache_register(register, value)
+
+    def set_registers(self, register_values, timeout=None):
+        """Write a list of (register, value) pairs in as few I2C
+        transactions as possible."""
+        if timeout is None:
+            register_values = [
+                (register, value)
+                for register, value in register_values
+                if self._reg_cache.get(register) != value
+            ]
+            if len(register_values) == 0:
+                return
+        logging.debug("set_registers(register_values=%s)" % (register_values,))
+        read_byte_count = 0
+        for start in range(0, len(register_values), BURST_REGISTERS):
+            burst = register_values[start : start + BURST_REGISTERS]
+            with self._scratch_lock:
+                serializer = self._serializer
+                serializer.reset()
+                for register, value in burst:
+                    serializer.append_uint16_be_uint32_be(register, value)
+                write_bytes = self._scratch[: serializer.length()]
+            self._i2c.i2c_transaction(
+                I2C_ADDRESS,
+                write_bytes,
+                read_byte_count,
+                timeout=timeout,
+            )
+            for register, value in burst:
+                self._cache_register(register, value)
+
+    def _cache_register(self, register, value):
+        if register in CACHEABLE_REGISTERS:
+            self._reg_cache[register] = value
 
     def configure_camera(self, height, width, bayer_format, pixel_format, frame_rate_s):
-        self.set_register(WIDTH, width)
-        self.set_register(HEIGHT, height)
-        self.set_register(BAYER_FORMAT, bayer_format.value)
-        self.set_register(PIXEL_FORMAT, pixel_format.value)
-        self.set_register(WATCHDOG, 20)
-        frames_per_minute = int(60.0 / frame_rate_s)
-        self.set_register(FRAMES_PER_MINUTE, frames_per_minute)
+        # Round, instead of truncating, so that floating point error
+        # in this division can't cost us a frame per minute.
+        frames_per_minute = int(round(60.0 / frame_rate_s))
+        self.set_registers(
+            [
+                (WIDTH, width),
+                (HEIGHT, height),
+                (BAYER_FORMAT, bayer_format.value),
+                (PIXEL_FORMAT, pixel_format.value),
+                (WATCHDOG, 20),
+                (FRAMES_PER_MINUTE, frames_per_minute),
+            ]
+        )
+        # Initialization is slow, so it gets its own transaction and timeout.
         self.set_register(
             INITIALIZE, 1, hololink_module.Timeout(timeout_s=30, retry_s=2)
         )
@@ -118,6 +194,8 @@ class UdpCam:
         self.set_register(WATCHDOG, watchdog_timeout_s)
 
     def configure_converter(self, converter):
+        # csi_size just returns constants from the CSI-2 spec; there's
+        # no device access here, so there's nothing worth caching.
         (
             frame_start_size,
             frame_end_size,
@@ -20,8 +20,10 @@
 #ifndef SRC_HOLOLINK_NATIVE_SERIALIZER
 #define SRC_HOLOLINK_NATIVE_SERIALIZER
 
+#include <endian.h>
 #include <stddef.h>
 #include <stdint.h>
+#include <string.h>
 
 namespace hololink::native {
 
@@ -39,6 +41,13 @@ public:
         return position_;
     }
 
+    // Discard everything appended so far, so that
+    // the buffer can be reused for a new message.
+    void reset()
+    {
+        position_ = 0;
+    }
+
     bool append_uint32_le(uint32_t value)
     {
         if ((position_ + 4) > limit_) {
@@ -87,6 +96,21 @@ public:
         return true;
     }
 
+    // Append a 16-bit value followed by a 32-bit value, both big-endian;
+    // this is the (register, value) layout used by many I2C peripherals.
+    bool append_uint16_be_uint32_be(uint16_t a, uint32_t b)
+    {
+        if ((position_ + 6) > limit_) {
+            return false;
+        }
+        uint16_t be16 = htobe16(a);
+        uint32_t be32 = htobe32(b);
+        memcpy(&buffer_[position_], &be16, sizeof(be16));
+        memcpy(&buffer_[position_ + 2], &be32, sizeof(be32));
+        position_ += 6;
+        return true;
+    }
+
     bool append_uint8(uint8_t value)
     {
         if ((position_ + 1) > limit_) {
@@ -25,21 +25,44 @@
 #include <poll.h>
 #include <pthread.h>
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
+#include <sys/mman.h>
 #include <sys/socket.h>
 #include <sys/types.h>
 #include <unistd.h>
+#include <vector>
 
 #include <infiniband/opcode.h>
+#ifdef HOLOLINK_IO_URING
+#include <liburing.h>
+#endif /* HOLOLINK_IO_URING */
 
 #include <hololink/hololink.hpp>
 #include <hololink/logging.hpp>
+#include <hololink/native/cuda_helper.hpp>
 #include <hololink/native/deserializer.hpp>
 #include <hololink/native/networking.hpp>
 #include <hololink/native/nvtx_trace.hpp>
 
 #define NUM_OF(x) (sizeof(x) / sizeof(x[0]))
 
+// Maximum number of UDP messages fetched by each recvmmsg call.
+#define RECV_MESSAGES (64)
+
+#ifdef HOLOLINK_IO_URING
+// Submission queue depth; we only ever have two requests outstanding:
+// the multishot receive and the POLL_ADD on control_r_.
+#define IO_URING_ENTRIES (8)
+// Number of UDP message buffers available to the kernel; must be a power of 2.
+#define IO_URING_BUFFERS (1024)
+#define IO_URING_BUFFER_GROUP (0)
+#define IO_URING_NAPI_BUSY_POLL_US (50)
+// user_data values that tell us which request a completion is for.
+#define IO_URING_RECV (1)
+#define IO_URING_CONTROL (2)
+#endif /* HOLOLINK_IO_URING */
+
 namespace hololink::operators {
 
 static inline struct timespec add_ms(struct timespec& ts, unsigned long ms)
@@ -61,35 +84,149 @@ static inline struct timespec add_ms(struct timespec& ts, unsigned long ms)
 
 class LinuxReceiverDescriptor {
 public:
-    LinuxReceiverDescriptor(uint8_t* memory)
+    LinuxReceiverDescriptor(uint8_t* memory, CUdeviceptr device_memory)
         : memory_(memory)
+        , device_memory_(device_memory)
     {
     }
 
     uint8_t* memory_;
+    CUdeviceptr device_memory_;
     LinuxReceiverMetadata metadata_;
 };
 
+LinuxReceiverPool::LinuxReceiverPool(size_t frame_size)
+    : buffer_size_(0)
+    , allocation_size_(0)
+    , mapped_(false)
+    , memory_(NULL)
+    , device_memory_(0)
+    , cu_context_(NULL)
+{
+    CUresult cu_result = cuCtxGetCurrent(&cu_context_);
+    if (cu_result != CUDA_SUCCESS) {
+        throw std::runtime_error(fmt::format("cuCtxGetCurrent failed, cu_result={}.", cu_result));
+    }
+    // Round the buffer size up to 64k
+#define BUFFER_ALIGNMENT (0x10000)
+    buffer_size_ = (frame_size + BUFFER_ALIGNMENT - 1) & ~(BUFFER_ALIGNMENT - 1);
+    // Back the buffers with huge pages, so that received data is spread
+    // over as few pages (and IOMMU/TLB entries) as possible.
+#define HUGE_PAGE_SIZE (0x200000)
+    allocation_size_ = (buffer_size_ * BUFFERS + HUGE_PAGE_SIZE - 1) & ~(HUGE_PAGE_SIZE - 1);
+    void* memory = mmap(NULL, allocation_size_, PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_ANONYMOUS | MAP_HUGETLB, -1, 0);
+    if (memory != MAP_FAILED) {
+        mapped_ = true;
+    } else {
+        // No (or not enough) huge pages are reserved; ask for
+        // transparent huge pages instead.
+        HSB_LOG_DEBUG("mmap(MAP_HUGETLB) failed, errno={}; using transparent huge pages.", errno);
+        int r = posix_memalign(&memory, HUGE_PAGE_SIZE, allocation_size_);
+        if (r != 0) {
+            throw std::runtime_error(fmt::format("posix_memalign failed, r={}.", r));
+        }
+        if (madvise(memory, allocation_size_, MADV_HUGEPAGE) != 0) {
+            HSB_LOG_DEBUG("madvise(MADV_HUGEPAGE) failed, errno={}.", errno);
+        }
+    }
+    memory_ = static_cast<uint8_t*>(memory);
+    // cuMemHostRegister pins the memory itself; mlock additionally faults
+    // in every page now instead of when the first frame arrives.
+    if (mlock(memory_, allocation_size_) != 0) {
+        HSB_LOG_DEBUG("mlock failed, errno={}.", errno);
+    }
+    // Map this into the GPU address space so that, with zero_copy,
+    // the pipeline can read received data without first copying it
+    // into cu_buffer.
+    unsigned flags = CU_MEMHOSTREGISTER_DEVICEMAP | CU_MEMHOSTREGISTER_PORTABLE;
+    cu_result = cuMemHostRegister(memory_, allocation_size_, flags);
+    if (cu_result != CUDA_SUCCESS) {
+        free_memory();
+        throw std::runtime_error(fmt::format("cuMemHostRegister failed, cu_result={}.", cu_result));
+    }
+    cu_result = cuMemHostGetDevicePointer(&device_memory_, memory_, 0);
+    if (cu_result != CUDA_SUCCESS) {
+        cuMemHostUnregister(memory_);
+        free_memory();
+        throw std::runtime_error(fmt::format("cuMemHostGetDevicePointer failed, cu_result={}.", cu_result));
+    }
+}
+
+LinuxReceiverPool::~LinuxReceiverPool()
+{
+    // We may be destroyed on a thread where some other context (or
+    // none at all) is current.
+    CUresult cu_result = cuCtxPushCurrent(cu_context_);
+    if (cu_result != CUDA_SUCCESS) {
+        HSB_LOG_ERROR("cuCtxPushCurrent failed, cu_result={}; leaking the receiver pool.", cu_result);
+        return;
+    }
+    cu_result = cuMemHostUnregister(memory_);
+    CUcontext popped;
+    cuCtxPopCurrent(&popped);
+    if (cu_result != CUDA_SUCCESS) {
+        // Freeing memory that's still registered with CUDA would leave
+        // the GPU with a mapping to whatever reuses those pages.
+        HSB_LOG_ERROR("cuMemHostUnregister failed, cu_result={}; leaking the receiver pool.", cu_result);
+        return;
+    }
+    free_memory();
+}
+
+void LinuxReceiverPool::free_memory()
+{
+    munlock(memory_, allocation_size_);
+    if (mapped_) {
+        munmap(memory_, allocation_size_);
+    } else {
+        free(memory_);
+    }
+    memory_ = NULL;
+}
+
 LinuxReceiver::LinuxReceiver(CUdeviceptr cu_buffer,
     size_t cu_buffer_size,
     int socket,
-    uint64_t received_address_offset)
+    uint64_t received_address_offset,
+    bool use_io_uring,
+    bool zero_copy,
+    std::shared_ptr<LinuxReceiverPool> pool)
     : cu_buffer_(cu_buffer)
     , cu_buffer_size_(cu_buffer_size)
     , socket_(socket)
     , received_address_offset_(received_address_offset)
+    , use_io_uring_(use_io_uring)
+    , zero_copy_(zero_copy)
+    , busy_poll_us_(0)
+    , pool_(pool)
+    , cu_context_(NULL)
+    , thread_()
+    , thread_started_(false)
     , ready_(false)
     , exit_(false)
+    , control_r_(-1)
+    , control_w_(-1)
     , ready_mutex_(PTHREAD_MUTEX_INITIALIZER)
     , ready_condition_(PTHREAD_COND_INITIALIZER)
+    , metadata_history_head_(0)
+    , metadata_history_tail_(0)
+    , metadata_history_condition_(PTHREAD_COND_INITIALIZER)
     , qp_number_(0xCAFE)
     , rkey_(0xBEEF)
-    , local_(NULL)
     , available_(NULL)
     , busy_(NULL)
+    , receiving_(NULL)
+    , buffer_size_(0)
     , cu_stream_(0)
     , frame_ready_([](const LinuxReceiver&) {})
 {
+    if (!pool_) {
+        pool_ = std::make_shared<LinuxReceiverPool>(cu_buffer_size_);
+    }
+    if (pool_->buffer_size() < cu_buffer_size_) {
+        throw std::runtime_error(fmt::format("LinuxReceiverPool buffer_size={} is smaller than cu_buffer_size={}.", pool_->buffer_size(), cu_buffer_size_));
+    }
+
     int r = pthread_mutex_init(&ready_mutex_, NULL);
     if (r != 0) {
         throw std::runtime_error("pthread_mutex_init failed.");
@@ -101,15 +238,19 @@ LinuxReceiver::LinuxReceiver(CUdeviceptr cu_buffer,
     if (r != 0) {
         throw std::runtime_error("pthread_cond_init failed.");
     }
+    r = pthread_cond_init(&metadata_history_condition_, &pthread_condattr);
+    if (r != 0) {
+        throw std::runtime_error("pthread_cond_init failed.");
+    }
 
-    // set the receive timeout, we use that to check to periodically return from the
-    // recv() call to check if the receiver thread should exit
-    struct timeval timeout;
-    timeout.tv_sec = 0;
-    timeout.tv_usec = 100000;
-    if (setsockopt(socket_, SOL_SOCKET, SO_RCVTIMEO, &timeout, sizeof(timeout)) < 0) {
-        throw std::runtime_error(fmt::format("setsockopt failed errno={}", errno));
+    int pipe_fds[2] = { -1, -1 };
+    // If these aren't updated, we'll get an error when we try to read, which is good.
+    r = pipe(pipe_fds);
+    if (r != 0) {
+        throw std::runtime_error("pipe call failed.");
     }
+    control_r_ = pipe_fds[0];
+    control_w_ = pipe_fds[1];
 
     // See get_next_frame.
     CUresult cu_result = cuStreamCreate(&cu_stream_, CU_STREAM_NON_BLOCKING);
@@ -120,47 +261,165 @@ LinuxReceiver::LinuxReceiver(CUdeviceptr cu_buffer,
 
 LinuxReceiver::~LinuxReceiver()
 {
+    // Don't let the receiver thread outlive the memory it's using.
+    if (thread_started_) {
+        close();
+        try {
+            join();
+        } catch (const std::exception& e) {
+            HSB_LOG_ERROR("LinuxReceiver join failed: {}", e.what());
+        }
+    }
+    if (control_w_ != -1) {
+        ::close(control_w_);
+    }
+    ::close(control_r_);
+    pthread_cond_destroy(&metadata_history_condition_);
     pthread_cond_destroy(&ready_condition_);
     pthread_mutex_destroy(&ready_mutex_);
 }
 
+void LinuxReceiver::start(CUcontext cu_context, const std::vector<int>& affinity)
+{
+    if (thread_started_) {
+        throw std::runtime_error("LinuxReceiver is already started.");
+    }
+    cu_context_ = cu_context;
+    pthread_attr_t pthread_attr;
+    int r = pthread_attr_init(&pthread_attr);
+    if (r != 0) {
+        throw std::runtime_error(fmt::format("pthread_attr_init returned r={}.", r));
+    }
+    // Setting affinity here, instead of from within the thread,
+    // guarantees that we never run (or touch memory) on any other core.
+    if (!affinity.empty()) {
+        cpu_set_t cpu_set;
+        CPU_ZERO(&cpu_set);
+        for (int cpu : affinity) {
+            if ((cpu < 0) || (cpu >= CPU_SETSIZE)) {
+                pthread_attr_destroy(&pthread_attr);
+                throw std::runtime_error(fmt::format("Invalid affinity cpu={}.", cpu));
+            }
+            CPU_SET(cpu, &cpu_set);
+        }
+        r = pthread_attr_setaffinity_np(&pthread_attr, sizeof(cpu_set), &cpu_set);
+        if (r != 0) {
+            pthread_attr_destroy(&pthread_attr);
+            throw std::runtime_error(fmt::format("pthread_attr_setaffinity_np returned r={}.", r));
+        }
+    }
+    r = pthread_create(&thread_, &pthread_attr, thread_main, this);
+    pthread_attr_destroy(&pthread_attr);
+    if (r != 0) {
+        throw std::runtime_error(fmt::format("pthread_create returned r={}.", r));
+    }
+    thread_started_ = true;
+}
+
+void* LinuxReceiver::thread_main(void* arg)
+{
+    LinuxReceiver* receiver = static_cast<LinuxReceiver*>(arg);
+    try {
+        CudaCheck(cuCtxSetCurrent(receiver->cu_context_));
+        receiver->run();
+    } catch (const std::exception& e) {
+        HSB_LOG_ERROR("LinuxReceiver terminated: {}", e.what());
+    }
+    return NULL;
+}
+
+void LinuxReceiver::join()
+{
+    if (!thread_started_) {
+        return;
+    }
+    int r = pthread_join(thread_, NULL);
+    if (r != 0) {
+        throw std::runtime_error(fmt::format("pthread_join returned r={}.", r));
+    }
+    thread_started_ = false;
+}
+
 void LinuxReceiver::run()
 {
     HSB_LOG_DEBUG("Starting.");
     native::NvtxTrace::setThreadName("linux_receiver");
 
-    // Round the buffer size up to 64k
-#define BUFFER_ALIGNMENT (0x10000)
-    uint64_t buffer_size = (cu_buffer_size_ + BUFFER_ALIGNMENT - 1) & ~(BUFFER_ALIGNMENT - 1);
-    // Allocate three pages, details below
-    CUresult cu_result = cuMemHostAlloc((void**)(&local_), buffer_size * 3, CU_MEMHOSTALLOC_WRITECOMBINED);
-    if (cu_result != CUDA_SUCCESS) {
-        throw std::runtime_error(fmt::format("cuMemHostAlloc failed, cu_result={}.", cu_result));
-    }
-    // Construct a descriptor for each page
-    LinuxReceiverDescriptor d0(&local_[buffer_size * 0]);
-    LinuxReceiverDescriptor d1(&local_[buffer_size * 1]);
-    LinuxReceiverDescriptor d2(&local_[buffer_size * 2]);
-    // receiving points to the section we're currently receiving into
+    // Construct a descriptor for each page of our pool
+    buffer_size_ = pool_->buffer_size();
+    LinuxReceiverDescriptor d0(pool_->buffer(0), pool_->device_buffer(0));
+    LinuxReceiverDescriptor d1(pool_->buffer(1), pool_->device_buffer(1));
+    LinuxReceiverDescriptor d2(pool_->buffer(2), pool_->device_buffer(2));
+    // receiving_ points to the section we're currently receiving into
     // busy_ points to the buffer that the application is using.
     // available_ points to the last completed frame
-    LinuxReceiverDescriptor* receiving = &d0;
+    receiving_ = &d0;
     busy_ = &d1;
     available_.store(&d2);
 
-    // Received UDP message goes here.
-    uint8_t received[hololink::native::UDP_PACKET_SIZE];
+    frame_count_ = 0;
+    packet_count_ = 0;
+    frame_packets_received_ = 0;
+    frame_bytes_received_ = 0;
+    frame_start_ = { 0 };
+    packets_dropped_ = 0;
+    last_psn_ = 0;
+    first_ = true;
+
+    bool done = false;
+    if (use_io_uring_) {
+        done = run_io_uring();
+    }
+    if (!done) {
+        run_recv();
+    }
 
-    unsigned frame_count = 0, packet_count = 0;
-    unsigned frame_packets_received = 0, frame_bytes_received = 0;
-    struct timespec now = { 0 }, frame_start = { 0 };
-    uint64_t packets_dropped = 0;
-    uint32_t last_psn = 0;
-    bool first = true;
+    receiving_ = NULL;
+    busy_ = NULL;
+    available_.store(NULL);
+    HSB_LOG_DEBUG("Done.");
+}
 
-    while (true) {
-        int recv_flags = 0;
-        ssize_t received_bytes = recv(socket_, received, sizeof(received), recv_flags);
+void LinuxReceiver::run_recv()
+{
+    // Received UDP messages go here; we fetch up to RECV_MESSAGES
+    // of them with each system call.
+    std::vector<uint8_t> received(RECV_MESSAGES * hololink::native::UDP_PACKET_SIZE);
+    struct iovec iovecs[RECV_MESSAGES];
+    struct mmsghdr messages[RECV_MESSAGES];
+    memset(messages, 0, sizeof(messages));
+    for (unsigned i = 0; i < RECV_MESSAGES; i++) {
+        iovecs[i].iov_base = &received[i * hololink::native::UDP_PACKET_SIZE];
+        iovecs[i].iov_len = hololink::native::UDP_PACKET_SIZE;
+        messages[i].msg_hdr.msg_iov = &iovecs[i];
+        messages[i].msg_hdr.msg_iovlen = 1;
+    }
+    struct timespec now = { 0 };
+
+    struct pollfd poll_fds[2] = {
+        {
+            .fd = control_r_,
+            .events = POLLIN | POLLHUP | POLLERR,
+        },
+        {
+            .fd = socket_,
+            .events = POLLIN | POLLERR,
+        }
+    };
+
+    // After the socket goes empty, we keep calling recvmmsg until
+    // busy_poll_us_ elapses; the next packet usually arrives before
+    // then, saving us the cost of sleeping and being woken up.
+    // (With SO_BUSY_POLL set, each of those calls also polls the
+    // network device queue.)
+    bool spinning = false;
+    int64_t spin_deadline_ns = 0;
+
+    while (!exit_) {
+        // Fetch whatever is already queued without blocking; we only
+        // wait (in poll, below) when the socket is empty.
+        int recv_flags = MSG_DONTWAIT;
+        int message_count = recvmmsg(socket_, messages, RECV_MESSAGES, recv_flags, NULL);
         int recv_errno = errno;
 
         // Get the clock as close to the packet receipt as possible.
@@ -169,144 +428,322 @@ void LinuxReceiver::run()
             break;
         }
 
-        HSB_LOG_TRACE("received_bytes={} recv_errno={}.", received_bytes, recv_errno);
+        HSB_LOG_TRACE("message_count={} recv_errno={}.", message_count, recv_errno);
 
-        if (received_bytes <= 0) {
-            // check if there is a timeout
+        if (message_count <= 0) {
             if ((recv_errno == EAGAIN) || (recv_errno == EWOULDBLOCK) || (recv_errno == EINTR)) {
-                // should we exit?
-                if (exit_) {
+                if (busy_poll_us_ > 0) {
+                    struct timespec spin_now;
+                    clock_gettime(CLOCK_MONOTONIC, &spin_now);
+                    int64_t spin_now_ns = spin_now.tv_sec * 1000000000LL + spin_now.tv_nsec;
+                    if (!spinning) {
+                        spinning = true;
+                        spin_deadline_ns = spin_now_ns + busy_poll_us_ * 1000LL;
+                        continue;
+                    }
+                    if (spin_now_ns < spin_deadline_ns) {
+                        continue;
+                    }
+                }
+                spinning = false;
+                int timeout = -1; // stay here until something happens.
+                int r = poll(poll_fds, NUM_OF(poll_fds), timeout);
+                if ((r == -1) && (errno != EINTR)) {
+                    HSB_LOG_ERROR("poll returned r={}, errno={}", r, errno);
+                    break;
+                }
+                // The only activity on control_r_ is close() closing
+                // control_w_, which tells us to terminate.
+                if (poll_fds[0].revents) {
+                    HSB_LOG_DEBUG("Closing.");
                     break;
                 }
-                // if not, continue
                 continue;
             }
-            HSB_LOG_ERROR("recv returned received_bytes={}, recv_errno={}", received_bytes, recv_errno);
+            HSB_LOG_ERROR("recvmmsg returned message_count={}, recv_errno={}", message_count, recv_errno);
             break;
         }
 
-        packet_count++;
-        frame_packets_received++;
-        if (!frame_bytes_received) {
-            frame_start = now;
+        spinning = false;
+        for (int i = 0; i < message_count; i++) {
+            receive_packet(static_cast<const uint8_t*>(iovecs[i].iov_base), messages[i].msg_len, now);
         }
+    }
+}
 
-        do {
-            native::Deserializer deserializer(received, received_bytes);
-            uint8_t opcode = 0, flags = 0;
-            uint16_t pkey = 0;
-            uint8_t becn = 0, ack_request = 0;
-            uint32_t qp = 0, psn = 0;
-            if (!(deserializer.next_uint8(opcode)
-                    && deserializer.next_uint8(flags)
-                    && deserializer.next_uint16_be(pkey)
-                    && deserializer.next_uint8(becn)
-                    && deserializer.next_uint24_be(qp)
-                    && deserializer.next_uint8(ack_request)
-                    && deserializer.next_uint24_be(psn))) {
-                HSB_LOG_ERROR("Unable to decode runt IB request, received_bytes={}", received_bytes);
+#ifdef HOLOLINK_IO_URING
+bool LinuxReceiver::run_io_uring()
+{
+    // With IORING_SETUP_DEFER_TASKRUN, completion work is only done
+    // when we call into io_uring_enter (via io_uring_submit_and_wait),
+    // which means that it always runs here on our receiver thread.
+    struct io_uring ring;
+    struct io_uring_params params = { 0 };
+    params.flags = IORING_SETUP_SINGLE_ISSUER | IORING_SETUP_DEFER_TASKRUN;
+    int r = io_uring_queue_init_params(IO_URING_ENTRIES, &ring, &params);
+    if (r == -EINVAL) {
+        // Kernels before 6.1 don't support DEFER_TASKRUN.
+        HSB_LOG_INFO("IORING_SETUP_DEFER_TASKRUN isn't supported; continuing without it.");
+        params = { 0 };
+        r = io_uring_queue_init_params(IO_URING_ENTRIES, &ring, &params);
+    }
+    if (r < 0) {
+        HSB_LOG_ERROR("io_uring_queue_init_params failed, r={}; using recv instead.", r);
+        return false;
+    }
+    // Our socket is fixed file index 0.
+    r = io_uring_register_files(&ring, &socket_, 1);
+    if (r < 0) {
+        HSB_LOG_ERROR("io_uring_register_files failed, r={}; using recv instead.", r);
+        io_uring_queue_exit(&ring);
+        return false;
+    }
+    // Each received UDP message lands in one of these buffers; the
+    // kernel picks an available one from buffer_ring on each message.
+    const size_t message_size = hololink::native::UDP_PACKET_SIZE;
+    std::vector<uint8_t> messages(IO_URING_BUFFERS * message_size);
+    struct io_uring_buf_ring* buffer_ring = io_uring_setup_buf_ring(&ring, IO_URING_BUFFERS, IO_URING_BUFFER_GROUP, 0, &r);
+    if (buffer_ring == NULL) {
+        // Provided buffer rings need kernel 5.19 or newer.
+        HSB_LOG_ERROR("io_uring_setup_buf_ring failed, r={}; using recv instead.", r);
+        io_uring_queue_exit(&ring);
+        return false;
+    }
+    const int mask = io_uring_buf_ring_mask(IO_URING_BUFFERS);
+    for (unsigned i = 0; i < IO_URING_BUFFERS; i++) {
+        io_uring_buf_ring_add(buffer_ring, &messages[i * message_size], message_size, i, mask, i);
+    }
+    io_uring_buf_ring_advance(buffer_ring, IO_URING_BUFFERS);
+
+#ifdef HOLOLINK_IO_URING_NAPI
+    // Busy poll the NIC queue instead of waiting for an interrupt.
+    struct io_uring_napi napi = { 0 };
+    napi.busy_poll_to = IO_URING_NAPI_BUSY_POLL_US;
+    napi.prefer_busy_poll = 1;
+    r = io_uring_register_napi(&ring, &napi);
+    if (r < 0) {
+        HSB_LOG_INFO("io_uring_register_napi failed, r={}; continuing without NAPI busy polling.", r);
+    }
+#endif /* HOLOLINK_IO_URING_NAPI */
+
+    // close() closing control_w_ completes this request, which
+    // is how we know to terminate.
+    struct io_uring_sqe* control_sqe = io_uring_get_sqe(&ring);
+    if (control_sqe == NULL) {
+        HSB_LOG_ERROR("io_uring_get_sqe failed; using recv instead.");
+        io_uring_free_buf_ring(&ring, buffer_ring, IO_URING_BUFFERS, IO_URING_BUFFER_GROUP);
+        io_uring_queue_exit(&ring);
+        return false;
+    }
+    io_uring_prep_poll_add(control_sqe, control_r_, POLLIN | POLLHUP | POLLERR);
+    io_uring_sqe_set_data64(control_sqe, IO_URING_CONTROL);
+
+    // This gets set when we need to (re)issue our multishot receive request.
+    bool arm = true;
+    // Multishot receive needs kernel 6.0 or newer; older kernels reject
+    // it with -EINVAL, which we'll only see before any data arrives.
+    bool received_any = false;
+    bool unsupported = false;
+    struct timespec now = { 0 };
+
+    while (!exit_) {
+        if (arm) {
+            struct io_uring_sqe* sqe = io_uring_get_sqe(&ring);
+            if (sqe == NULL) {
+                HSB_LOG_ERROR("io_uring_get_sqe failed.");
                 break;
             }
+            io_uring_prep_recv_multishot(sqe, 0, NULL, 0, 0);
+            sqe->flags |= IOSQE_FIXED_FILE | IOSQE_BUFFER_SELECT;
+            sqe->buf_group = IO_URING_BUFFER_GROUP;
+            io_uring_sqe_set_data64(sqe, IO_URING_RECV);
+            arm = false;
+        }
+
+        r = io_uring_submit_and_wait(&ring, 1);
 
-            // Note that 'psn' is only 24 bits.  Use that to determine
-            // how many packets were dropped.  Note that this doesn't
-            // account for out-of-order delivery.
-            native::NvtxTrace::event_u64("psn", psn);
-            native::NvtxTrace::event_u64("frame_packets_received", frame_packets_received);
-            if (!first) {
-                uint32_t next_psn = (last_psn + 1) & 0xFFFFFF;
-                uint32_t diff = (psn - next_psn) & 0xFFFFFF;
-                packets_dropped += diff;
+        // Get the clock as close to the packet receipt as possible.
+        if (clock_gettime(CLOCK_REALTIME, &now) != 0) {
+            HSB_LOG_ERROR("clock_gettime failed, errno={}", errno);
+            break;
+        }
+
+        if (r == -EINTR) {
+            continue;
+        }
+        if (r < 0) {
+            HSB_LOG_ERROR("io_uring_submit_and_wait returned r={}", r);
+            break;
+        }
+
+        struct io_uring_cqe* cqe = NULL;
+        unsigned head = 0, completions = 0, buffers = 0;
+        bool failed = false;
+        io_uring_for_each_cqe(&ring, head, cqe)
+        {
+            completions++;
+            if (io_uring_cqe_get_data64(cqe) == IO_URING_CONTROL) {
+                HSB_LOG_DEBUG("Closing.");
+                exit_ = true;
+                continue;
             }
-            last_psn = psn;
-            first = false;
-
-            uint64_t address = 0;
-            uint32_t rkey = 0;
-            uint32_t size = 0;
-            const uint8_t* content = NULL;
-            if ((opcode == IBV_OPCODE_UC_RDMA_WRITE_ONLY)
-                && deserializer.next_uint64_be(address)
-                && deserializer.next_uint32_be(rkey)
-                && deserializer.next_uint32_be(size)
-                && deserializer.pointer(content, size)) {
-                HSB_LOG_TRACE("opcode=2A address={:x} size={:x}", address, size);
-                uint64_t target_address = address + received_address_offset_;
-                if ((target_address >= cu_buffer_) && (target_address + size <= (cu_buffer_ + cu_buffer_size_))) {
-                    uint64_t offset = target_address - cu_buffer_;
-                    memcpy(&receiving->memory_[offset], content, size);
-                    frame_bytes_received += size;
-                }
-                break;
+            if (!(cqe->flags & IORING_CQE_F_MORE)) {
+                // The kernel terminated our multishot request; e.g.
+                // on -ENOBUFS when we're not returning buffers fast enough.
+                arm = true;
             }
-
-            uint32_t imm_data = 0;
-            if ((opcode == IBV_OPCODE_UC_RDMA_WRITE_ONLY_WITH_IMMEDIATE)
-                && deserializer.next_uint64_be(address)
-                && deserializer.next_uint32_be(rkey)
-                && deserializer.next_uint32_be(size)
-                && deserializer.next_uint32_be(imm_data)
-                && deserializer.pointer(content, size)) {
-                frame_count++;
-                native::NvtxTrace::event_u64("frame_count", frame_count);
-
-                HSB_LOG_TRACE("opcode=2B address={:#x} size={:x}", address, size);
-                uint64_t target_address = address + received_address_offset_;
-                if ((target_address >= cu_buffer_) && (target_address + size <= (cu_buffer_ + cu_buffer_size_))) {
-                    uint64_t offset = target_address - cu_buffer_;
-                    memcpy(&receiving->memory_[offset], content, size);
-                    frame_bytes_received += size;
+            if (cqe->res < 0) {
+                if ((cqe->res == -EINVAL) && !received_any) {
+                    HSB_LOG_ERROR("io_uring multishot receive isn't supported; using recv instead.");
+                    unsupported = true;
+                    failed = true;
+                } else if (cqe->res != -ENOBUFS) {
+                    HSB_LOG_ERROR("io_uring receive failed, res={}", cqe->res);
+                    failed = true;
                 }
-                // Send it
-                // - receiving now has legit data;
-                // - swap it with available_, now
-                //  available_ points to received data
-                //  and we'll continue to receive into what
-                //  was in available_ (but not consumed by
-                //  the application)
-                // - signal the pipeline so it wakes up if necessary.
-                Hololink::FrameMetadata frame_metadata = Hololink::deserialize_metadata(content, size);
-                LinuxReceiverMetadata& metadata = receiving->metadata_;
-                metadata.frame_packets_received = frame_packets_received;
-                metadata.frame_bytes_received = frame_bytes_received;
-                metadata.frame_number = frame_count;
-                metadata.frame_start_s = frame_start.tv_sec;
-                metadata.frame_start_ns = frame_start.tv_nsec;
-                metadata.frame_end_s = now.tv_sec;
-                metadata.frame_end_ns = now.tv_nsec;
-                metadata.imm_data = imm_data;
-                metadata.packets_dropped = packets_dropped;
-                metadata.received_s = now.tv_sec;
-                metadata.received_ns = now.tv_nsec;
-                metadata.frame_metadata = frame_metadata;
-
-                receiving = available_.exchange(receiving);
-                signal();
-                // Make it easy to identify missing packets.
-                memset(receiving->memory_, 0xFF, buffer_size);
-                // Reset metadata.
-                frame_packets_received = 0;
-                frame_bytes_received = 0;
-                break;
+                continue;
+            }
+            received_any = true;
+            if (!(cqe->flags & IORING_CQE_F_BUFFER)) {
+                continue;
             }
+            unsigned buffer_id = cqe->flags >> IORING_CQE_BUFFER_SHIFT;
+            uint8_t* received = &messages[buffer_id * message_size];
+            HSB_LOG_TRACE("received_bytes={}.", cqe->res);
+            receive_packet(received, cqe->res, now);
+            // Hand the buffer back to the kernel.
+            io_uring_buf_ring_add(buffer_ring, received, message_size, buffer_id, mask, buffers);
+            buffers++;
+        }
+        io_uring_buf_ring_advance(buffer_ring, buffers);
+        io_uring_cq_advance(&ring, completions);
+        if (failed) {
+            break;
+        }
+    }
+
+    io_uring_free_buf_ring(&ring, buffer_ring, IO_URING_BUFFERS, IO_URING_BUFFER_GROUP);
+    io_uring_queue_exit(&ring);
+    return !unsupported;
+}
+#else /* HOLOLINK_IO_URING */
+bool LinuxReceiver::run_io_uring()
+{
+    HSB_LOG_ERROR("io_uring support isn't included in this build; using recv instead.");
+    return false;
+}
+#endif /* HOLOLINK_IO_URING */
 
-            HSB_LOG_ERROR("Unable to decode IB request with opcode={:x}", opcode);
-        } while (false);
+void LinuxReceiver::receive_packet(const uint8_t* received, size_t received_bytes, const struct timespec& now)
+{
+    packet_count_++;
+    frame_packets_received_++;
+    if (!frame_bytes_received_) {
+        frame_start_ = now;
     }
 
-    busy_ = NULL;
-    available_.store(NULL);
+    native::Deserializer deserializer(received, received_bytes);
+    uint8_t opcode = 0, flags = 0;
+    uint16_t pkey = 0;
+    uint8_t becn = 0, ack_request = 0;
+    uint32_t qp = 0, psn = 0;
+    if (!(deserializer.next_uint8(opcode)
+            && deserializer.next_uint8(flags)
+            && deserializer.next_uint16_be(pkey)
+            && deserializer.next_uint8(becn)
+            && deserializer.next_uint24_be(qp)
+            && deserializer.next_uint8(ack_request)
+            && deserializer.next_uint24_be(psn))) {
+        HSB_LOG_ERROR("Unable to decode runt IB request, received_bytes={}", received_bytes);
+        return;
+    }
 
-    cu_result = cuMemFreeHost((void*)(local_));
-    if (cu_result != CUDA_SUCCESS) {
-        HSB_LOG_ERROR("cuMemFreeHost failed, cu_result={}", cu_result);
+    // Note that 'psn' is only 24 bits.  Use that to determine
+    // how many packets were dropped.  Note that this doesn't
+    // account for out-of-order delivery.
+    native::NvtxTrace::event_u64("psn", psn);
+    native::NvtxTrace::event_u64("frame_packets_received", frame_packets_received_);
+    if (!first_) {
+        uint32_t next_psn = (last_psn_ + 1) & 0xFFFFFF;
+        uint32_t diff = (psn - next_psn) & 0xFFFFFF;
+        packets_dropped_ += diff;
+    }
+    last_psn_ = psn;
+    first_ = false;
+
+    uint64_t address = 0;
+    uint32_t rkey = 0;
+    uint32_t size = 0;
+    const uint8_t* content = NULL;
+    if ((opcode == IBV_OPCODE_UC_RDMA_WRITE_ONLY)
+        && deserializer.next_uint64_be(address)
+        && deserializer.next_uint32_be(rkey)
+        && deserializer.next_uint32_be(size)
+        && deserializer.pointer(content, size)) {
+        HSB_LOG_TRACE("opcode=2A address={:x} size={:x}", address, size);
+        uint64_t target_address = address + received_address_offset_;
+        if ((target_address >= cu_buffer_) && (target_address + size <= (cu_buffer_ + cu_buffer_size_))) {
+            uint64_t offset = target_address - cu_buffer_;
+            memcpy(&receiving_->memory_[offset], content, size);
+            frame_bytes_received_ += size;
+        }
         return;
     }
-    local_ = NULL;
-    HSB_LOG_DEBUG("Done.");
+
+    uint32_t imm_data = 0;
+    if ((opcode == IBV_OPCODE_UC_RDMA_WRITE_ONLY_WITH_IMMEDIATE)
+        && deserializer.next_uint64_be(address)
+        && deserializer.next_uint32_be(rkey)
+        && deserializer.next_uint32_be(size)
+        && deserializer.next_uint32_be(imm_data)
+        && deserializer.pointer(content, size)) {
+        frame_count_++;
+        native::NvtxTrace::event_u64("frame_count", frame_count_);
+
+        HSB_LOG_TRACE("opcode=2B address={:#x} size={:x}", address, size);
+        uint64_t target_address = address + received_address_offset_;
+        if ((target_address >= cu_buffer_) && (target_address + size <= (cu_buffer_ + cu_buffer_size_))) {
+            uint64_t offset = target_address - cu_buffer_;
+            memcpy(&receiving_->memory_[offset], content, size);
+            frame_bytes_received_ += size;
+        }
+        // Send it
+        // - receiving_ now has legit data;
+        // - swap it with available_, now
+        //  available_ points to received data
+        //  and we'll continue to receive into what
+        //  was in available_ (but not consumed by
+        //  the application)
+        // - signal the pipeline so it wakes up if necessary.
+        Hololink::FrameMetadata frame_metadata = Hololink::deserialize_metadata(content, size);
+        LinuxReceiverMetadata& metadata = receiving_->metadata_;
+        metadata.frame_packets_received = frame_packets_received_;
+        metadata.frame_bytes_received = frame_bytes_received_;
+        metadata.frame_number = frame_count_;
+        metadata.frame_start_s = frame_start_.tv_sec;
+        metadata.frame_start_ns = frame_start_.tv_nsec;
+        metadata.frame_end_s = now.tv_sec;
+        metadata.frame_end_ns = now.tv_nsec;
+        metadata.imm_data = imm_data;
+        metadata.packets_dropped = packets_dropped_;
+        metadata.received_s = now.tv_sec;
+        metadata.received_ns = now.tv_nsec;
+        metadata.frame_metadata = frame_metadata;
+
+        receiving_ = available_.exchange(receiving_);
+        signal(metadata);
+        // Make it easy to identify missing packets.
+        memset(receiving_->memory_, 0xFF, buffer_size_);
+        // Reset metadata.
+        frame_packets_received_ = 0;
+        frame_bytes_received_ = 0;
+        return;
+    }
+
+    HSB_LOG_ERROR("Unable to decode IB request with opcode={:x}", opcode);
 }
 
-void LinuxReceiver::signal()
+void LinuxReceiver::signal(const LinuxReceiverMetadata& metadata)
 {
     int r = pthread_mutex_lock(&ready_mutex_);
     if (r != 0) {
@@ -317,6 +754,16 @@ void LinuxReceiver::signal()
     if (r != 0) {
         throw std::runtime_error(fmt::format("pthread_cond_signal returned r={}.", r));
     }
+    // If nobody is fetching the history, drop the oldest entry.
+    if ((metadata_history_head_ - metadata_history_tail_) == METADATA_HISTORY) {
+        metadata_history_tail_++;
+    }
+    metadata_history_[metadata_history_head_ % METADATA_HISTORY] = metadata;
+    metadata_history_head_++;
+    r = pthread_cond_signal(&metadata_history_condition_);
+    if (r != 0) {
+        throw std::runtime_error(fmt::format("pthread_cond_signal returned r={}.", r));
+    }
     r = pthread_mutex_unlock(&ready_mutex_);
     if (r != 0) {
         throw std::runtime_error(fmt::format("pthread_mutex_unlock returned r={}.", r));
@@ -332,6 +779,13 @@ bool LinuxReceiver::get_next_frame(unsigned timeout_ms, LinuxReceiverMetadata& m
     if (r) {
         busy_ = available_.exchange(busy_);
         if (busy_) {
+            metadata = busy_->metadata_;
+            if (zero_copy_) {
+                // The pipeline reads busy_ directly; run() won't write to
+                // it until we swap it out on the next call to get_next_frame.
+                metadata.frame_memory = busy_->device_memory_;
+                return r;
+            }
             // Because we're setting up the next frame of data for
             // pipeline processing, we can allow this memcpy to overlap
             // with other GPU work-- we just make sure that this copy is done
@@ -348,7 +802,7 @@ bool LinuxReceiver::get_next_frame(unsigned timeout_ms, LinuxReceiverMetadata& m
                     r = false;
                 }
             }
-            metadata = busy_->metadata_;
+            metadata.frame_memory = cu_buffer_;
         } else {
             // run() exited.
             HSB_LOG_ERROR("get_next_frame failed, receiver has terminated.");
@@ -358,6 +812,40 @@ bool LinuxReceiver::get_next_frame(unsigned timeout_ms, LinuxReceiverMetadata& m
     return r;
 }
 
+unsigned LinuxReceiver::get_next_frames_metadata(unsigned count, unsigned timeout_ms, LinuxReceiverMetadata* metadata)
+{
+    int status = pthread_mutex_lock(&ready_mutex_);
+    if (status != 0) {
+        throw std::runtime_error(fmt::format("pthread_mutex_lock returned status={}.", status));
+    }
+    struct timespec now;
+    if (clock_gettime(CLOCK_MONOTONIC, &now) != 0) {
+        HSB_LOG_ERROR("clock_gettime failed, errno={}", errno);
+    }
+    struct timespec timeout = add_ms(now, timeout_ms);
+
+    while (metadata_history_head_ == metadata_history_tail_) {
+        status = pthread_cond_timedwait(&metadata_history_condition_, &ready_mutex_, &timeout);
+        if (status == ETIMEDOUT) {
+            break;
+        }
+        if (status != 0) {
+            HSB_LOG_ERROR("pthread_cond_wait returned status={}", status);
+            break;
+        }
+    }
+    unsigned r = 0;
+    for (; (r < count) && (metadata_history_tail_ != metadata_history_head_); r++) {
+        metadata[r] = metadata_history_[metadata_history_tail_ % METADATA_HISTORY];
+        metadata_history_tail_++;
+    }
+    status = pthread_mutex_unlock(&ready_mutex_);
+    if (status != 0) {
+        throw std::runtime_error(fmt::format("pthread_mutex_unlock returned status={}.", status));
+    }
+    return r;
+}
+
 bool LinuxReceiver::wait(unsigned timeout_ms)
 {
     int status = pthread_mutex_lock(&ready_mutex_);
@@ -392,6 +880,10 @@ bool LinuxReceiver::wait(unsigned timeout_ms)
 void LinuxReceiver::close()
 {
     exit_ = true;
+    if (control_w_ != -1) {
+        ::close(control_w_);
+        control_w_ = -1;
+    }
 }
 
 void LinuxReceiver::set_frame_ready(std::function<void(const LinuxReceiver&)> frame_ready)
@@ -399,4 +891,9 @@ void LinuxReceiver::set_frame_ready(std::function<void(const LinuxReceiver&)> fr
     frame_ready_ = frame_ready;
 }
 
+void LinuxReceiver::set_busy_poll(unsigned busy_poll_us)
+{
+    busy_poll_us_ = busy_poll_us;
+}
+
 } // namespace hololink::operators
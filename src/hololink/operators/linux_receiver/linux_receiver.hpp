@@ -21,8 +21,13 @@
 #define SRC_HOLOLINK_OPERATORS_LINUX_RECEIVER_LINUX_RECEIVER
 
 #include <atomic>
+#include <functional>
+#include <memory>
+#include <pthread.h>
 #include <semaphore.h>
 #include <stdint.h>
+#include <time.h>
+#include <vector>
 
 #include <cuda.h>
 
@@ -47,17 +52,81 @@ public:
     uint64_t packets_dropped;
     // Data received directly from HSB.
     Hololink::FrameMetadata frame_metadata;
+    // GPU address of the received frame data; this is the
+    // cu_buffer given to the constructor unless zero_copy is set.
+    CUdeviceptr frame_memory;
 };
 
 class LinuxReceiverDescriptor;
 
+/**
+ * Pinned, device mapped host memory that LinuxReceiver assembles
+ * received frames into.  Allocating this is expensive, so applications
+ * can construct it once and reuse it with each LinuxReceiver instance.
+ * Only one LinuxReceiver may be running with a given pool at a time.
+ * The memory is backed by 2MB huge pages when the system provides them.
+ */
+class LinuxReceiverPool {
+public:
+    // LinuxReceiver triple-buffers received frames.
+    static constexpr unsigned BUFFERS = 3;
+
+    /**
+     * @param frame_size is the largest frame that a LinuxReceiver
+     * using this pool will receive.  The memory is registered with
+     * the CUDA context that is current when this is called; the
+     * destructor unregisters it in that same context.
+     */
+    explicit LinuxReceiverPool(size_t frame_size);
+
+    ~LinuxReceiverPool();
+
+    // We own memory_; copies would unregister and free it twice.
+    LinuxReceiverPool(const LinuxReceiverPool&) = delete;
+    LinuxReceiverPool& operator=(const LinuxReceiverPool&) = delete;
+
+    size_t buffer_size() const { return buffer_size_; };
+
+    uint8_t* buffer(unsigned index) { return &memory_[buffer_size_ * index]; };
+
+    CUdeviceptr device_buffer(unsigned index) { return device_memory_ + buffer_size_ * index; };
+
+protected:
+    void free_memory();
+
+    size_t buffer_size_;
+    size_t allocation_size_;
+    // true if memory_ came from mmap, false for posix_memalign.
+    bool mapped_;
+    uint8_t* memory_;
+    CUdeviceptr device_memory_;
+    // The context memory_ is registered with.
+    CUcontext cu_context_;
+};
+
 class LinuxReceiver {
 public:
+    /**
+     * @param use_io_uring if true, and sensor bridge was built with liburing,
+     * receive packets using an io_uring instance instead of recv();
+     * otherwise this flag is ignored.
+     * @param zero_copy if true, get_next_frame doesn't copy received
+     * data into cu_buffer; instead, metadata.frame_memory points to
+     * the (device mapped) host memory that the data was received into.
+     * @param pool provides the memory that frames are received into;
+     * if not given, the receiver allocates its own.
+     */
     LinuxReceiver(CUdeviceptr cu_buffer,
         size_t cu_buffer_size,
         int socket,
-        uint64_t received_address_offset);
+        uint64_t received_address_offset,
+        bool use_io_uring = false,
+        bool zero_copy = false,
+        std::shared_ptr<LinuxReceiverPool> pool = nullptr);
 
+    /**
+     * If the receiver thread is running, close() and join() it first.
+     */
     ~LinuxReceiver();
 
     /**
@@ -68,7 +137,21 @@ public:
     void run();
 
     /**
-     * Set a flag that will encourage run() to return.
+     * Create a thread that calls run() with cu_context current.
+     * The thread is created with the given processor affinity
+     * (when not empty), so it never runs on any other core.
+     */
+    void start(CUcontext cu_context, const std::vector<int>& affinity);
+
+    /**
+     * Wait for the thread created by start() to terminate;
+     * call close() first to inspire it to do so.
+     */
+    void join();
+
+    /**
+     * Tell run() to return; this wakes it immediately
+     * even if it's waiting for a packet.
      */
     void close();
 
@@ -81,6 +164,17 @@ public:
      */
     bool get_next_frame(unsigned timeout_ms, LinuxReceiverMetadata& metadata);
 
+    /**
+     * Fetch the metadata for up to count frames, oldest first, that
+     * arrived since the last call; blocks for up to timeout_ms until
+     * at least one is available.  Only the most recent METADATA_HISTORY
+     * frames are kept.  This doesn't affect what get_next_frame returns.
+     * @returns the number of entries written to metadata.
+     */
+    unsigned get_next_frames_metadata(unsigned count, unsigned timeout_ms, LinuxReceiverMetadata* metadata);
+
+    static constexpr unsigned METADATA_HISTORY = 64;
+
     uint32_t get_qp_number() { return qp_number_; };
 
     uint32_t get_rkey() { return rkey_; };
@@ -91,29 +185,76 @@ public:
      */
     void set_frame_ready(std::function<void(const LinuxReceiver&)> frame_ready);
 
+    /**
+     * When the socket goes empty, keep checking it for busy_poll_us
+     * microseconds before sleeping in poll; 0 (the default) sleeps
+     * right away.  Call this before start().
+     */
+    void set_busy_poll(unsigned busy_poll_us);
+
 protected:
     // Blocks execution until signal() is called;
     // @returns false if timeout_ms elapses before
     // signal is observed.
     bool wait(unsigned timeout_ms);
 
-    // Pass a message to wait() telling it to wake up.
-    void signal();
+    // Pass a message to wait() telling it to wake up,
+    // and record metadata in our history.
+    void signal(const LinuxReceiverMetadata& metadata);
+
+    // Thread entry point used by start().
+    static void* thread_main(void* arg);
+
+    // Receive loops; run() calls exactly one of these.
+    void run_recv();
+    // @returns false if io_uring isn't usable on this system (or this
+    // build doesn't include it), in which case the caller should fall
+    // back to run_recv().
+    bool run_io_uring();
+
+    // Decode a single received UDP message and accumulate
+    // its content into the frame being received.
+    void receive_packet(const uint8_t* received, size_t received_bytes, const struct timespec& now);
 
 protected:
     CUdeviceptr cu_buffer_;
     size_t cu_buffer_size_;
     int socket_;
     uint64_t received_address_offset_;
+    bool use_io_uring_;
+    bool zero_copy_;
+    unsigned busy_poll_us_;
+    std::shared_ptr<LinuxReceiverPool> pool_;
+    CUcontext cu_context_;
+    pthread_t thread_;
+    bool thread_started_;
     bool volatile ready_;
     bool volatile exit_;
+    // close() closes control_w_, which wakes up our receiver thread.
+    int control_r_;
+    int control_w_;
     pthread_mutex_t ready_mutex_;
     pthread_cond_t ready_condition_;
+    // Ring of recently received frame metadata; guarded by ready_mutex_.
+    LinuxReceiverMetadata metadata_history_[METADATA_HISTORY];
+    uint64_t metadata_history_head_;
+    uint64_t metadata_history_tail_;
+    pthread_cond_t metadata_history_condition_;
     uint32_t qp_number_;
     uint32_t rkey_;
-    uint8_t* local_;
     std::atomic<LinuxReceiverDescriptor*> available_;
     LinuxReceiverDescriptor* busy_;
+    // State owned by the receiver thread
+    LinuxReceiverDescriptor* receiving_;
+    uint64_t buffer_size_;
+    unsigned frame_count_;
+    unsigned packet_count_;
+    unsigned frame_packets_received_;
+    unsigned frame_bytes_received_;
+    struct timespec frame_start_;
+    uint64_t packets_dropped_;
+    uint32_t last_psn_;
+    bool first_;
     CUstream cu_stream_; // Used to control cuMemcpyHtoDAsync.
     std::function<void(const LinuxReceiver&)> frame_ready_;
 };
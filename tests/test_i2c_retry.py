@@ -110,7 +110,10 @@ def test_i2c_retry(udpcam):
                 logging.info(f"---- {n=}")
                 hololink._drop = n
                 hololink._sent = 0
-                new_version = camera.get_version()
+                # get_version caches its result, so read the register directly.
+                new_version = camera.get_register(
+                    hololink_module.sensors.udp_cam.VERSION
+                )
                 logging.info(f"{version=}, {hololink._sent=}")
                 assert version == new_version
                 camera.tap_watchdog()
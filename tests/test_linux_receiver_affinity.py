@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# See README.md for detailed information.
+
+import os
+
+import pytest
+from hololink.operators.linux_receiver_operator import _available_cpus, _parse_affinity
+
+
+@pytest.fixture
+def all_cpus(monkeypatch):
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(16)))
+
+
+def test_parse_affinity(all_cpus):
+    assert _parse_affinity("4") == {4}
+    assert _parse_affinity("2,4-7") == {2, 4, 5, 6, 7}
+    assert _parse_affinity("5-5") == {5}
+    # Whitespace and empty items are ignored.
+    assert _parse_affinity(" 2, 4 - 5 ") == {2, 4, 5}
+    assert _parse_affinity("2,") == {2}
+    assert _parse_affinity(",,3") == {3}
+
+
+def test_parse_affinity_unavailable(all_cpus):
+    # CPUs we're not allowed to run on are dropped.
+    assert _parse_affinity("14-17") == {14, 15}
+    assert _parse_affinity("20") is None
+    assert _parse_affinity(" ") is None
+
+
+@pytest.mark.parametrize("affinity", ["4-", "-4", "7-4", "a", "2,x-3", "1-2-3"])
+def test_parse_affinity_invalid(all_cpus, affinity):
+    with pytest.raises(ValueError, match="HOLOLINK_AFFINITY"):
+        _parse_affinity(affinity)
+
+
+def test_available_cpus(all_cpus):
+    # This is how an explicit receiver_affinity is checked; CPUs we can't
+    # run on, including ones that can't be in a cpu_set_t, are dropped.
+    assert _available_cpus([3, 100000], "receiver_affinity") == {3}
+    assert _available_cpus([-1, 100000], "receiver_affinity") is None
@@ -0,0 +1,134 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# See README.md for detailed information.
+
+import logging
+import socket
+import types
+
+import pytest
+from hololink.operators.linux_receiver_operator import (
+    DEFAULT_RCVBUF,
+    SO_RCVBUFFORCE,
+    LinuxReceiverOperator,
+)
+
+FRAME_SIZE = 1920 * 1080 * 2
+
+
+class FakeSocket:
+    """Behaves like the kernel does for SO_RCVBUF: values set are
+    doubled, SO_RCVBUF is limited by rmem_max, and SO_RCVBUFFORCE
+    needs CAP_NET_ADMIN."""
+
+    def __init__(self, rcvbuf, rmem_max=212992, net_admin=False):
+        self._rcvbuf = rcvbuf
+        self._rmem_max = rmem_max
+        self._net_admin = net_admin
+        self.calls = []
+
+    def getsockopt(self, level, option):
+        assert (level, option) == (socket.SOL_SOCKET, socket.SO_RCVBUF)
+        return self._rcvbuf
+
+    def setsockopt(self, level, option, value):
+        assert level == socket.SOL_SOCKET
+        self.calls.append(option)
+        if option == SO_RCVBUFFORCE:
+            if not self._net_admin:
+                raise PermissionError("Operation not permitted")
+            self._rcvbuf = 2 * value
+        elif option == socket.SO_RCVBUF:
+            self._rcvbuf = 2 * min(value, self._rmem_max)
+        else:
+            assert False and "Unexpected socket option."
+
+
+def check_buffer_size(data_socket, data_memory_size=FRAME_SIZE):
+    operator = types.SimpleNamespace(_data_socket=data_socket)
+    LinuxReceiverOperator._check_buffer_size(operator, data_memory_size)
+
+
+@pytest.fixture(autouse=True)
+def default_rcvbuf(monkeypatch):
+    monkeypatch.delenv("HOLOLINK_RCVBUF", raising=False)
+
+
+def test_already_provisioned():
+    data_socket = FakeSocket(rcvbuf=2 * DEFAULT_RCVBUF)
+    check_buffer_size(data_socket)
+    assert data_socket.calls == []
+
+
+def test_rmem_default_is_not_doubled():
+    # A size inherited from net.core.rmem_default is reported as-is,
+    # so it's only half of what setting DEFAULT_RCVBUF would give us.
+    data_socket = FakeSocket(rcvbuf=DEFAULT_RCVBUF, net_admin=True)
+    check_buffer_size(data_socket)
+    assert data_socket.calls == [SO_RCVBUFFORCE]
+    assert data_socket._rcvbuf == 2 * DEFAULT_RCVBUF
+
+
+def test_rcvbufforce(caplog):
+    data_socket = FakeSocket(rcvbuf=212992, net_admin=True)
+    with caplog.at_level(logging.INFO):
+        check_buffer_size(data_socket)
+    assert data_socket.calls == [SO_RCVBUFFORCE]
+    assert data_socket._rcvbuf == 2 * DEFAULT_RCVBUF
+    assert "rmem_max" not in caplog.text
+
+
+def test_rcvbuf_fallback(caplog):
+    data_socket = FakeSocket(rcvbuf=212992, rmem_max=DEFAULT_RCVBUF)
+    with caplog.at_level(logging.INFO):
+        check_buffer_size(data_socket)
+    assert data_socket.calls == [SO_RCVBUFFORCE, socket.SO_RCVBUF]
+    assert data_socket._rcvbuf == 2 * DEFAULT_RCVBUF
+    assert "rmem_max" not in caplog.text
+
+
+def test_smaller_than_requested(caplog):
+    # Enough for a frame, but not for a burst.
+    data_socket = FakeSocket(rcvbuf=212992, rmem_max=FRAME_SIZE)
+    with caplog.at_level(logging.INFO):
+        check_buffer_size(data_socket)
+    infos = [r for r in caplog.records if r.levelno == logging.INFO]
+    assert "smaller than requested" in caplog.text
+    assert "net.core.rmem_max=%d" % (DEFAULT_RCVBUF,) in caplog.text
+    assert all(r.levelno < logging.WARNING for r in caplog.records)
+    assert len(infos) == 2
+
+
+def test_too_small(caplog):
+    data_socket = FakeSocket(rcvbuf=212992, rmem_max=FRAME_SIZE // 2)
+    with caplog.at_level(logging.INFO):
+        check_buffer_size(data_socket)
+    warnings = [r for r in caplog.records if r.levelno == logging.WARNING]
+    assert len(warnings) == 2
+    assert "too small" in warnings[0].getMessage()
+    assert "net.core.rmem_max=%d" % (DEFAULT_RCVBUF,) in warnings[1].getMessage()
+
+
+def test_request_size(monkeypatch):
+    # HOLOLINK_RCVBUF overrides the default request...
+    monkeypatch.setenv("HOLOLINK_RCVBUF", str(1024 * 1024))
+    data_socket = FakeSocket(rcvbuf=212992, net_admin=True)
+    check_buffer_size(data_socket, data_memory_size=1000)
+    assert data_socket._rcvbuf == 2 * 1024 * 1024
+    # ...but we always ask for at least one frame, rounded up to 64k.
+    data_socket = FakeSocket(rcvbuf=212992, net_admin=True)
+    check_buffer_size(data_socket, data_memory_size=3 * 1024 * 1024 + 1)
+    assert data_socket._rcvbuf == 2 * (3 * 1024 * 1024 + 0x10000)
@@ -0,0 +1,223 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# See README.md for detailed information.
+
+import contextlib
+import gc
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+import pytest
+import udp_server
+
+import hololink as hololink_module
+
+cuda = pytest.importorskip("cuda.cuda", reason="Use 'pip3 install cuda-python'.")
+
+FRAME_SIZE = 4096
+# Hololink::deserialize_metadata wants at least this much.
+METADATA_SIZE = 48
+METADATA_HISTORY = 64
+# Before close() woke the receiver thread directly, it could take
+# this long (SO_RCVTIMEO) to notice; make sure we're well under that.
+OLD_CLOSE_LATENCY_S = 0.1
+
+
+@pytest.fixture
+def cu_context():
+    (cu_result,) = cuda.cuInit(0)
+    if cu_result != cuda.CUresult.CUDA_SUCCESS:
+        pytest.skip("CUDA isn't available.")
+    cu_result, device_count = cuda.cuDeviceGetCount()
+    if (cu_result != cuda.CUresult.CUDA_SUCCESS) or (device_count == 0):
+        pytest.skip("No GPU is available.")
+    cu_result, cu_device = cuda.cuDeviceGet(0)
+    assert cu_result == cuda.CUresult.CUDA_SUCCESS
+    cu_result, cu_context = cuda.cuDevicePrimaryCtxRetain(cu_device)
+    assert cu_result == cuda.CUresult.CUDA_SUCCESS
+    (cu_result,) = cuda.cuCtxSetCurrent(cu_context)
+    assert cu_result == cuda.CUresult.CUDA_SUCCESS
+    yield cu_context
+    cuda.cuDevicePrimaryCtxRelease(cu_device)
+
+
+class LoopbackReceiver:
+    """A started LinuxReceiver listening on a localhost UDP socket,
+    with helpers to send it RoCE packets.  Access the receiver and its
+    pool (which is registered in cu_context) only through these
+    attributes, so that they're destroyed at the end of
+    loopback_receiver, before the CUDA resources are released."""
+
+    def __init__(self, frame_memory, data_socket, pool, receiver):
+        self.frame_memory = frame_memory
+        self.pool = pool
+        self.receiver = receiver
+        self._address = data_socket.getsockname()
+        self._sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._qp = receiver.get_qp_number()
+        self._rkey = receiver.get_rkey()
+
+    def send_write(self, offset, content):
+        packet = udp_server.format_write(
+            self._qp, self.frame_memory + offset, content, rkey=self._rkey
+        )
+        self._sender.sendto(packet, self._address)
+
+    def send_frame_end(self, psn=0, immediate_value=0):
+        # The last packet of a frame carries the frame metadata.
+        content = struct.pack("!III", 0, psn, 0).ljust(METADATA_SIZE, b"\0")
+        offset = FRAME_SIZE - METADATA_SIZE
+        packet = udp_server.format_write_immediate(
+            self._qp,
+            self.frame_memory + offset,
+            content,
+            rkey=self._rkey,
+            immediate_value=immediate_value,
+        )
+        self._sender.sendto(packet, self._address)
+
+    def close(self):
+        self._sender.close()
+
+
+@contextlib.contextmanager
+def loopback_receiver(cu_context, zero_copy=False):
+    cu_result, cu_buffer = cuda.cuMemAlloc(FRAME_SIZE)
+    assert cu_result == cuda.CUresult.CUDA_SUCCESS
+    frame_memory = int(cu_buffer)
+    data_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    data_socket.bind(("127.0.0.1", 0))
+    pool = hololink_module.operators.LinuxReceiverPool(FRAME_SIZE)
+    receiver = hololink_module.operators.LinuxReceiver(
+        frame_memory,
+        FRAME_SIZE,
+        data_socket.fileno(),
+        0,
+        zero_copy=zero_copy,
+        pool=pool,
+    )
+    loopback = LoopbackReceiver(frame_memory, data_socket, pool, receiver)
+    del pool, receiver
+    loopback.receiver.start(cu_context)
+    try:
+        yield loopback
+    finally:
+        loopback.receiver.close()
+        loopback.receiver.join()
+        loopback.receiver = None
+        loopback.pool = None
+        gc.collect()
+        loopback.close()
+        data_socket.close()
+        cuda.cuMemFree(cu_buffer)
+
+
+def test_linux_receiver_get_next_frames(cu_context):
+    with loopback_receiver(cu_context) as loopback:
+        # Send more frames than the history holds; each is a single
+        # write-immediate packet carrying just the frame metadata.
+        frame_count = METADATA_HISTORY + 16
+        for i in range(frame_count):
+            loopback.send_frame_end(psn=i, immediate_value=i)
+            # Don't overrun the socket buffer.
+            time.sleep(0.001)
+
+        # Wait for the last frame to arrive.
+        deadline = time.monotonic() + 5
+        ok, metadata = False, None
+        while time.monotonic() < deadline:
+            ok, metadata = loopback.receiver.get_next_frame(1000)
+            if ok and metadata.frame_number == frame_count:
+                break
+        assert ok
+        assert metadata.frame_number == frame_count
+
+        # The structured array has the same fields as metadata.as_dict().
+        frames = loopback.receiver.get_next_frames(1000, 1000)
+        assert set(frames.dtype.names) == set(metadata.as_dict().keys())
+
+        # Only the newest METADATA_HISTORY frames are kept, oldest first.
+        assert len(frames) == METADATA_HISTORY
+        expected = list(range(frame_count - METADATA_HISTORY + 1, frame_count + 1))
+        assert list(frames["frame_number"]) == expected
+        assert list(frames["psn"]) == [n - 1 for n in expected]
+
+        # Everything has been fetched now.
+        assert len(loopback.receiver.get_next_frames(1, 100)) == 0
+
+
+def close_and_join(receiver):
+    start = time.monotonic()
+    receiver.close()
+    receiver.join()
+    return time.monotonic() - start
+
+
+def test_linux_receiver_close_when_idle(cu_context):
+    with loopback_receiver(cu_context) as loopback:
+        # Give the receiver thread time to go to sleep in poll.
+        time.sleep(0.1)
+        elapsed = close_and_join(loopback.receiver)
+    assert elapsed < OLD_CLOSE_LATENCY_S / 2
+
+
+def test_linux_receiver_close_with_traffic(cu_context):
+    with loopback_receiver(cu_context) as loopback:
+        done = threading.Event()
+
+        def send():
+            content = bytes(1024)
+            while not done.is_set():
+                loopback.send_write(0, content)
+
+        sender = threading.Thread(target=send, name="sender", daemon=True)
+        sender.start()
+        try:
+            # Let the receiver get busy.
+            time.sleep(0.1)
+            elapsed = close_and_join(loopback.receiver)
+        finally:
+            done.set()
+            sender.join()
+    assert elapsed < OLD_CLOSE_LATENCY_S / 2
+
+
+def test_linux_receiver_zero_copy(cu_context):
+    with loopback_receiver(cu_context, zero_copy=True) as loopback:
+        payload = bytes(range(256))
+        loopback.send_write(0, payload)
+        loopback.send_frame_end()
+        ok, metadata = loopback.receiver.get_next_frame(1000)
+        assert ok
+        frame_memory = metadata.frame_memory
+
+        # We get a pointer into one of the pool's buffers, not cu_buffer.
+        assert frame_memory != loopback.frame_memory
+        buffer_size = loopback.pool.buffer_size()
+        buffers = [
+            loopback.pool.device_buffer(i)
+            for i in range(hololink_module.operators.LinuxReceiverPool.BUFFERS)
+        ]
+        assert any(b <= frame_memory < b + buffer_size for b in buffers)
+
+        # and the received data is visible through it.
+        host = np.zeros(len(payload), dtype=np.uint8)
+        (cu_result,) = cuda.cuMemcpyDtoH(host.ctypes.data, frame_memory, len(payload))
+        assert cu_result == cuda.CUresult.CUDA_SUCCESS
+        assert host.tobytes() == payload
@@ -192,3 +192,26 @@ def test_deserialize_uint64_le():
     )
     deserializer = hololink.Deserializer(b)
     assert deserializer.next_uint64_le() == 0x536A7B8C5A6B7C8A
+
+
+def test_serializer_reset():
+    b = bytearray(6)
+    serializer = hololink.Serializer(b)
+    assert serializer.append_uint16_be(0x1234)
+    assert serializer.append_uint32_be(0x5678_9ABC)
+    assert serializer.length() == 6
+    serializer.reset()
+    assert serializer.length() == 0
+    # We can fill the buffer again after reset.
+    assert serializer.append_uint16_be(0xDEF0)
+    assert serializer.append_uint32_be(0x1122_3344)
+    assert serializer.length() == 6
+    assert b == bytearray([0xDE, 0xF0, 0x11, 0x22, 0x33, 0x44])
+
+
+def test_serialize_uint16_be_uint32_be():
+    b = bytearray(50)
+    serializer = hololink.Serializer(b)
+    assert serializer.append_uint16_be_uint32_be(0x1234, 0x5678_9ABC)
+    assert b[:6] == bytearray([0x12, 0x34, 0x56, 0x78, 0x9A, 0xBC])
+    assert serializer.length() == 6
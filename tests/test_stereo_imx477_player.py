@@ -20,8 +20,6 @@ from unittest import mock
 
 import pytest
 
-from examples import stereo_imx477_player
-
 
 @pytest.mark.skip_unless_imx477
 @pytest.mark.accelerated_networking
@@ -34,6 +32,10 @@ from examples import stereo_imx477_player
 def test_stereo_imx477_player_player(
     camera_mode, headless, frame_limit, hololink_address, capsys
 ):
+    # Importing this loads CUDA and Holoscan; doing it here instead of at
+    # module scope keeps test collection fast when this test is skipped.
+    from examples import stereo_imx477_player
+
     arguments = [
         sys.argv[0],
         "--frame-limit",
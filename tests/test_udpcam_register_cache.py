@@ -0,0 +1,83 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# See README.md for detailed information.
+
+import logging
+
+import pytest
+import udp_server
+
+import hololink as hololink_module
+
+udp_cam = hololink_module.sensors.udp_cam
+
+CACHED_REGISTERS = [
+    udp_cam.WIDTH,
+    udp_cam.HEIGHT,
+    udp_cam.BAYER_FORMAT,
+    udp_cam.PIXEL_FORMAT,
+    udp_cam.FRAMES_PER_MINUTE,
+]
+UNCACHED_REGISTERS = [
+    udp_cam.WATCHDOG,
+    udp_cam.INITIALIZE,
+]
+
+
+def test_udpcam_register_cache(udpcam):
+    if udpcam is not None:
+        pytest.skip("Register writes are only counted by our own udp_server.")
+    logging.info("Initializing.")
+    camera_mode = (
+        480,
+        640,
+        hololink_module.sensors.csi.BayerFormat.RGGB,
+        hololink_module.sensors.csi.PixelFormat.RAW_8,
+        1 / 60.0,
+    )
+
+    with udp_server.TestServer(udpcam) as server:
+        channel_metadata = server.channel_metadata()
+        hololink_channel = hololink_module.DataChannel(channel_metadata)
+        hololink = hololink_channel.hololink()
+        hololink.start()
+
+        camera = udp_cam.UdpCam(hololink_channel)
+        camera.reset()
+        # Earlier tests may have written these registers too.
+        initial = server.register_write_counts()
+        camera.configure(*camera_mode)
+        first = server.register_write_counts()
+        for register in CACHED_REGISTERS + UNCACHED_REGISTERS:
+            assert first[register] == initial[register] + 1
+
+        # Configuring the same mode again only sends the registers
+        # that have side effects.
+        camera.configure(*camera_mode)
+        second = server.register_write_counts()
+        for register in CACHED_REGISTERS:
+            assert second[register] == first[register]
+        for register in UNCACHED_REGISTERS:
+            assert second[register] == first[register] + 1
+
+        # After reset, everything is sent again.
+        camera.reset()
+        camera.configure(*camera_mode)
+        third = server.register_write_counts()
+        for register in CACHED_REGISTERS + UNCACHED_REGISTERS:
+            assert third[register] == second[register] + 1
+
+        hololink.stop()
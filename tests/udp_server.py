@@ -52,6 +52,10 @@ image_memory = multiprocessing.Array(ctypes.c_uint8, image_size_limit)
 # total-size, height, width, bpp
 image_memory_metadata = multiprocessing.Array(ctypes.c_uint32, [0, 0, 0, 0])
 
+# How many times set_cam_i2c_register was called for each register ID;
+# shared so that the test process can see what the server received.
+register_write_counts = multiprocessing.Array(ctypes.c_uint32, 256)
+
 csi_image_data = None
 csi_image_length = None
 
@@ -121,6 +125,8 @@ def set_cam_i2c_register(register_id, value):
         "set_cam_i2c_register(register_id=%d(0x%X), value=%d(0x%X))"
         % (register_id, register_id, value, value)
     )
+    with register_write_counts.get_lock():
+        register_write_counts[register_id] += 1
     if register_id == hololink_module.sensors.udp_cam.RESET:
         pass
     elif register_id == hololink_module.sensors.udp_cam.WIDTH:
@@ -191,25 +197,30 @@ def cam_i2c(memory, i2c_address):
             | (value_bytes[3] << 0)
         )
         memory[reg_data_buffer] = msb_value
-    # Register writes look like this
-    elif (write_byte_count == 6) and (read_byte_count == 0):
+    # Register writes look like this; a single transaction
+    # may include any number of (register, value) pairs.
+    elif (
+        (write_byte_count > 0)
+        and (write_byte_count % 6 == 0)
+        and (read_byte_count == 0)
+    ):
         # udpcam wants the MSB of the address at the lowest address
-        w0 = memory[reg_data_buffer]
-        w1 = memory[reg_data_buffer + 4]
-        b = bytearray(
-            [
-                (w0 >> 0) & 0xFF,
-                (w0 >> 8) & 0xFF,
-                (w0 >> 16) & 0xFF,
-                (w0 >> 24) & 0xFF,
-                (w1 >> 0) & 0xFF,
-                (w1 >> 8) & 0xFF,
-            ]
-        )
-        deserializer = hololink_module.Deserializer(b)
-        register_id = deserializer.next_uint16_be()
-        value = deserializer.next_uint32_be()
-        set_cam_i2c_register(register_id, value)
+        b = bytearray()
+        for i in range(0, write_byte_count, 4):
+            w = memory[reg_data_buffer + i]
+            b.extend(
+                [
+                    (w >> 0) & 0xFF,
+                    (w >> 8) & 0xFF,
+                    (w >> 16) & 0xFF,
+                    (w >> 24) & 0xFF,
+                ]
+            )
+        deserializer = hololink_module.Deserializer(b[:write_byte_count])
+        for _ in range(write_byte_count // 6):
+            register_id = deserializer.next_uint16_be()
+            value = deserializer.next_uint32_be()
+            set_cam_i2c_register(register_id, value)
     else:
         assert False and "Unexpected register access."
 
@@ -570,6 +581,13 @@ class TestServer:
             r = np.array(u).reshape(height, width, bpp)
         return r
 
+    def register_write_counts(self):
+        """Returns a list, indexed by register ID, of how many
+        times the camera was asked to write that register."""
+        global register_write_counts
+        with register_write_counts.get_lock():
+            return list(register_write_counts)
+
     def channel_metadata(self):
         sensor = 0
         hololink_channel_configuration = BOOTP_TRANSACTION_ID_MAP[sensor]